@@ -0,0 +1,79 @@
+"""baseline schema
+
+Tables as created by create_tables() before migrations were introduced.
+Databases that already have these tables should be stamped with
+``alembic stamp 0001`` before running ``alembic upgrade head``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-05-01 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "projects",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=200), nullable=False),
+        sa.Column("location", sa.String(length=200), nullable=False),
+        sa.Column("contractor", sa.String(length=100), nullable=False),
+        sa.Column("start_date", sa.Date(), nullable=False),
+        sa.Column("end_date", sa.Date(), nullable=False),
+        sa.Column("owner", sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_projects_id", "projects", ["id"])
+
+    op.create_table(
+        "construction_inspections",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("project_id", sa.Integer(), nullable=False),
+        sa.Column("subproject_name", sa.String(length=200), nullable=False),
+        sa.Column("inspection_form_name", sa.String(length=200), nullable=False),
+        sa.Column("inspection_date", sa.Date(), nullable=False),
+        sa.Column("location", sa.String(length=200), nullable=False),
+        sa.Column("timing", sa.String(length=20), nullable=False),
+        sa.Column("result", sa.String(length=20), nullable=False),
+        sa.Column("remark", sa.Text(), nullable=True),
+        sa.Column("pdf_path", sa.String(length=255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["project_id"], ["projects.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_construction_inspections_id", "construction_inspections", ["id"])
+
+    op.create_table(
+        "inspection_photos",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("inspection_id", sa.Integer(), nullable=False),
+        sa.Column("photo_path", sa.String(length=255), nullable=False),
+        sa.Column("capture_date", sa.Date(), nullable=False),
+        sa.Column("caption", sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(["inspection_id"], ["construction_inspections.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_inspection_photos_id", "inspection_photos", ["id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_inspection_photos_id", table_name="inspection_photos")
+    op.drop_table("inspection_photos")
+    op.drop_index("ix_construction_inspections_id", table_name="construction_inspections")
+    op.drop_table("construction_inspections")
+    op.drop_index("ix_projects_id", table_name="projects")
+    op.drop_table("projects")
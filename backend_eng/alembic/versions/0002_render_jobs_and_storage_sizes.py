@@ -0,0 +1,57 @@
+"""render jobs and recorded storage sizes
+
+Adds the render_jobs table used by background PDF generation and the
+file size columns used for per-project storage accounting. Run
+``python reconcile_storage.py`` afterwards to fill in sizes for files
+uploaded before this migration.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-05-01 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "render_jobs",
+        sa.Column("id", sa.String(length=36), nullable=False),
+        sa.Column("inspection_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("pdf_path", sa.String(length=255), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["inspection_id"], ["construction_inspections.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    with op.batch_alter_table("projects") as batch_op:
+        batch_op.add_column(sa.Column("storage_bytes", sa.BigInteger(), nullable=False, server_default="0"))
+    with op.batch_alter_table("construction_inspections") as batch_op:
+        batch_op.add_column(sa.Column("pdf_size", sa.BigInteger(), nullable=False, server_default="0"))
+    with op.batch_alter_table("inspection_photos") as batch_op:
+        batch_op.add_column(sa.Column("file_size", sa.BigInteger(), nullable=False, server_default="0"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("inspection_photos") as batch_op:
+        batch_op.drop_column("file_size")
+    with op.batch_alter_table("construction_inspections") as batch_op:
+        batch_op.drop_column("pdf_size")
+    with op.batch_alter_table("projects") as batch_op:
+        batch_op.drop_column("storage_bytes")
+    op.drop_table("render_jobs")
@@ -0,0 +1,39 @@
+"""secondary indexes for foreign key and filter columns
+
+Covers the hot list queries: inspections by project (ordered by date),
+photos by inspection and projects by owner.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-05-01 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_construction_inspections_project_id_inspection_date",
+        "construction_inspections",
+        ["project_id", "inspection_date"],
+    )
+    op.create_index("ix_inspection_photos_inspection_id", "inspection_photos", ["inspection_id"])
+    op.create_index("ix_projects_owner_id", "projects", ["owner", "id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_projects_owner_id", table_name="projects")
+    op.drop_index("ix_inspection_photos_inspection_id", table_name="inspection_photos")
+    op.drop_index("ix_construction_inspections_project_id_inspection_date", table_name="construction_inspections")
@@ -0,0 +1,33 @@
+"""indexes on stored file paths
+
+Uploads are stored once per content and shared between rows, so deleting a
+row has to count the remaining references to its file by path.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-05-08 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_construction_inspections_pdf_path", "construction_inspections", ["pdf_path"])
+    op.create_index("ix_inspection_photos_photo_path", "inspection_photos", ["photo_path"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_inspection_photos_photo_path", table_name="inspection_photos")
+    op.drop_index("ix_construction_inspections_pdf_path", table_name="construction_inspections")
@@ -0,0 +1,72 @@
+"""per-form inspection sequence number
+
+Stores the 1-based count of each inspection among the inspections of the same
+form in its project, so it can be filtered and sorted through an index instead
+of being derived on every page load. Existing inspections are numbered in the
+order they were created, like new ones.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-05-15 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("construction_inspections") as batch_op:
+        batch_op.add_column(sa.Column("inspection_sequence", sa.Integer(), nullable=False, server_default="1"))
+
+    # Number the existing inspections of each form in each project in creation order
+    inspections = sa.table(
+        "construction_inspections",
+        sa.column("id", sa.Integer),
+        sa.column("project_id", sa.Integer),
+        sa.column("inspection_form_name", sa.String),
+        sa.column("inspection_sequence", sa.Integer),
+    )
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(inspections.c.id, inspections.c.project_id, inspections.c.inspection_form_name).order_by(
+            inspections.c.project_id,
+            inspections.c.inspection_form_name,
+            inspections.c.id,
+        )
+    )
+    updates = []
+    previous_group = None
+    for inspection_id, project_id, form_name in rows:
+        sequence = sequence + 1 if (project_id, form_name) == previous_group else 1
+        previous_group = (project_id, form_name)
+        updates.append({"row_id": inspection_id, "sequence": sequence})
+    if updates:
+        connection.execute(
+            inspections.update()
+            .where(inspections.c.id == sa.bindparam("row_id"))
+            .values(inspection_sequence=sa.bindparam("sequence")),
+            updates,
+        )
+
+    op.create_index(
+        "ix_construction_inspections_project_id_form_sequence",
+        "construction_inspections",
+        ["project_id", "inspection_form_name", "inspection_sequence"],
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_construction_inspections_project_id_form_sequence", table_name="construction_inspections")
+    with op.batch_alter_table("construction_inspections") as batch_op:
+        batch_op.drop_column("inspection_sequence")
@@ -1,34 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
+from fastapi.responses import FileResponse
+from PyPDF2.errors import PdfReadError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import date
-from app.db.database import get_db
-from app.services import crud
+import os
+from app.db.database import get_db, get_async_db
+from app.services import crud, async_crud
 from app.schemas import schemas
-from app.utils.file_utils import save_pdf_file, generate_inspection_pdf
+from app.utils.file_utils import save_pdf_file, new_pin, unpin_stored_file
+from app.utils.pdf_preview import (
+    pdf_page_count,
+    preview_width,
+    get_pdf_page_preview,
+    render_pdf_page_preview,
+    PDF_PREVIEW_DEFAULT_WIDTH,
+    PDF_PREVIEW_MAX_WIDTH
+)
+from app.utils.pagination import next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.services.jobs import submit_pdf_render, run_in_render_pool
 
 router = APIRouter()
 
 @router.post("/inspections/", response_model=schemas.Inspection, status_code=status.HTTP_201_CREATED)
-async def create_inspection(inspection: schemas.InspectionCreate, db: Session = Depends(get_db)):
+async def create_inspection(inspection: schemas.InspectionCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new inspection"""
-    return crud.create_inspection(db=db, inspection=inspection)
+    return await async_crud.create_inspection(db=db, inspection=inspection)
 
-@router.get("/inspections/", response_model=List[schemas.Inspection])
+@router.get("/inspections/", response_model=schemas.Page[schemas.Inspection])
 def read_inspections(
-    skip: int = 0, 
-    limit: int = 100, 
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     project_id: Optional[int] = None,
+    inspection_form_name: Optional[str] = None,
+    inspection_sequence: Optional[int] = Query(None, ge=1),
+    sort: Literal["date", "sequence"] = "date",
     db: Session = Depends(get_db)
 ):
-    """Get all inspections, optionally filtered by project_id"""
-    inspections = crud.get_inspections(db, skip=skip, limit=limit, project_id=project_id)
-    return inspections
+    """
+    Get a page of inspections, optionally filtered by project_id, form name and
+    per-form sequence number. Ordered by date, or by form name and sequence
+    number with sort=sequence.
+    """
+    sort_columns = crud.INSPECTION_SORT if sort == "date" else crud.INSPECTION_SEQUENCE_SORT
+    inspections = crud.get_inspections(
+        db,
+        limit=limit,
+        cursor=cursor,
+        project_id=project_id,
+        inspection_form_name=inspection_form_name,
+        inspection_sequence=inspection_sequence,
+        sort_columns=sort_columns
+    )
+    return {"items": inspections, "next_cursor": next_cursor(inspections, sort_columns, limit)}
+
+@router.post("/inspections/batch", response_model=List[schemas.InspectionWithPhotos])
+def read_inspections_batch(batch: schemas.InspectionBatchRequest, db: Session = Depends(get_db)):
+    """Get several inspections by ID with their photos"""
+    return crud.get_inspections_with_photos(db, inspection_ids=batch.ids)
 
 @router.get("/inspections/{inspection_id}", response_model=schemas.InspectionWithPhotos)
 def read_inspection(inspection_id: int, db: Session = Depends(get_db)):
     """Get a specific inspection by ID with its photos"""
-    inspection = crud.get_inspection(db, inspection_id=inspection_id)
+    inspection = crud.get_inspection_with_photos(db, inspection_id=inspection_id)
     return inspection
 
 @router.put("/inspections/{inspection_id}", response_model=schemas.Inspection)
@@ -49,43 +84,74 @@ def delete_inspection(inspection_id: int, db: Session = Depends(get_db)):
 async def upload_inspection_pdf(
     inspection_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload a PDF for an inspection"""
-    inspection = crud.get_inspection(db, inspection_id=inspection_id)
+    inspection = await async_crud.get_inspection(db, inspection_id)
     
-    # Save the PDF file
-    pdf_path = await save_pdf_file(file)
-    
-    # Update the inspection with the PDF path
-    inspection_update = schemas.InspectionUpdate(
-        result=inspection.result,
-        remark=inspection.remark,
-        pdf_path=pdf_path
-    )
-    
-    updated_inspection = crud.update_inspection(db, inspection_id, inspection_update)
+    # Save the PDF file, pinned so a concurrent delete cannot remove a reused copy
+    pin = new_pin()
+    pdf_path = await save_pdf_file(file, pin=pin)
+    try:
+        # Update the inspection with the PDF path
+        inspection_update = schemas.InspectionUpdate(
+            result=inspection.result,
+            remark=inspection.remark,
+            pdf_path=pdf_path
+        )
+        
+        updated_inspection = await async_crud.update_inspection(db, inspection_id, inspection_update)
+    finally:
+        unpin_stored_file(pdf_path, pin)
     return updated_inspection
 
-@router.post("/inspections/{inspection_id}/generate-pdf", response_model=schemas.Inspection)
-async def generate_inspection_report(
+@router.post(
+    "/inspections/{inspection_id}/generate-pdf",
+    response_model=schemas.RenderJob,
+    status_code=status.HTTP_202_ACCEPTED
+)
+def generate_inspection_report(
     inspection_id: int,
     db: Session = Depends(get_db)
 ):
-    """Generate a PDF report with inspection data and photos"""
-    # Get the inspection and its photos
+    """Queue a PDF report build with inspection data and photos; poll /jobs/{job_id} for the result"""
     inspection = crud.get_inspection(db, inspection_id=inspection_id)
-    photos = crud.get_photos(db, inspection_id=inspection_id)
-    
-    # Generate the PDF
-    pdf_path = generate_inspection_pdf(inspection, photos)
+    return submit_pdf_render(db, inspection, inspection.photos)
+
+def _inspection_pdf_page_count(db: Session, inspection_id: int):
+    """Return the PDF path and page count of an inspection, or raise 404/422"""
+    inspection = crud.get_inspection(db, inspection_id=inspection_id)
+    if not inspection.pdf_path or not os.path.exists(inspection.pdf_path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="PDF not found")
+    try:
+        return inspection.pdf_path, pdf_page_count(inspection.pdf_path)
+    except (PdfReadError, OSError):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="PDF could not be read")
+
+@router.get("/inspections/{inspection_id}/pdf/pages", response_model=schemas.PdfPages)
+def read_inspection_pdf_pages(inspection_id: int, db: Session = Depends(get_db)):
+    """Get the number of pages of an inspection's PDF"""
+    _, page_count = _inspection_pdf_page_count(db, inspection_id)
+    return {"page_count": page_count}
+
+@router.get("/inspections/{inspection_id}/pdf/pages/{page}.png", response_class=FileResponse)
+def read_inspection_pdf_page(
+    inspection_id: int,
+    page: int,
+    width: int = Query(PDF_PREVIEW_DEFAULT_WIDTH, ge=1, le=PDF_PREVIEW_MAX_WIDTH),
+    db: Session = Depends(get_db)
+):
+    """
+    Get one page (1-based) of an inspection's PDF as a PNG image.
     
-    # Update the inspection with the PDF path
-    inspection_update = schemas.InspectionUpdate(
-        result=inspection.result,
-        remark=inspection.remark,
-        pdf_path=pdf_path
-    )
+    Pages are rendered once in the render pool and then served from the disk cache.
+    """
+    pdf_path, page_count = _inspection_pdf_page_count(db, inspection_id)
+    if not 1 <= page <= page_count:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Page not found")
     
-    updated_inspection = crud.update_inspection(db, inspection_id, inspection_update)
-    return updated_inspection
+    width = preview_width(width)
+    path = get_pdf_page_preview(pdf_path, page, width)
+    if path is None:
+        path = run_in_render_pool(render_pdf_page_preview, pdf_path, page, width)
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "public, max-age=86400"})
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from app.db.database import get_db
+from app.services import crud
+from app.schemas import schemas
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}", response_model=schemas.RenderJob)
+def read_job(job_id: str, db: Session = Depends(get_db)):
+    """Get the status of a background render job"""
+    return crud.get_render_job(db, job_id=job_id)
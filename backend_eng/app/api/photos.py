@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date
-from app.db.database import get_db
-from app.services import crud
+import os
+from app.db.database import get_db, get_async_db
+from app.services import crud, async_crud
 from app.schemas import schemas
-from app.utils.file_utils import save_photo_file
+from app.utils.file_utils import (
+    save_photo_file,
+    new_pin,
+    unpin_stored_file,
+    create_photo_derivatives,
+    get_photo_derivative,
+    PHOTO_DERIVATIVE_SIZES
+)
+from app.utils.pagination import next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
@@ -15,35 +27,55 @@ async def create_photo(
     capture_date: date = Form(...),
     caption: Optional[str] = Form(None),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload a new photo for an inspection"""
     # Verify the inspection exists
-    inspection = crud.get_inspection(db, inspection_id=inspection_id)
-    
-    # Save the photo file
-    photo_path = await save_photo_file(file)
-    
-    # Create the photo record
-    photo_data = schemas.PhotoCreate(
-        inspection_id=inspection_id,
-        photo_path=photo_path,
-        capture_date=capture_date,
-        caption=caption
-    )
+    inspection = await async_crud.get_inspection(db, inspection_id)
     
-    return crud.create_photo(db=db, photo=photo_data)
+    # Save the photo file, pinned so a concurrent delete cannot remove a reused copy
+    pin = new_pin()
+    photo_path = await save_photo_file(file, pin=pin)
+    try:
+        # Create the thumbnail and preview next to the original
+        await run_in_threadpool(create_photo_derivatives, photo_path)
+        
+        # Create the photo record
+        photo_data = schemas.PhotoCreate(
+            inspection_id=inspection_id,
+            photo_path=photo_path,
+            capture_date=capture_date,
+            caption=caption
+        )
+        
+        return await async_crud.create_photo(db, photo_data)
+    finally:
+        unpin_stored_file(photo_path, pin)
 
-@router.get("/photos/", response_model=List[schemas.Photo])
+@router.get("/photos/", response_model=schemas.Page[schemas.PhotoWithInspection])
 def read_photos(
-    skip: int = 0, 
-    limit: int = 100, 
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     inspection_id: Optional[int] = None,
+    project_id: Optional[int] = None,
+    inspection_form_name: Optional[str] = None,
+    inspection_sequence: Optional[int] = Query(None, ge=1),
     db: Session = Depends(get_db)
 ):
-    """Get all photos, optionally filtered by inspection_id"""
-    photos = crud.get_photos(db, skip=skip, limit=limit, inspection_id=inspection_id)
-    return photos
+    """
+    Get a page of photos with their inspection's project, form name, location and
+    per-form sequence number, optionally filtered by any of them
+    """
+    photos = crud.get_photos_with_inspection(
+        db,
+        limit=limit,
+        cursor=cursor,
+        inspection_id=inspection_id,
+        project_id=project_id,
+        inspection_form_name=inspection_form_name,
+        inspection_sequence=inspection_sequence
+    )
+    return {"items": photos, "next_cursor": next_cursor(photos, crud.PHOTO_SORT, limit)}
 
 @router.get("/photos/{photo_id}", response_model=schemas.Photo)
 def read_photo(photo_id: int, db: Session = Depends(get_db)):
@@ -51,6 +83,20 @@ def read_photo(photo_id: int, db: Session = Depends(get_db)):
     photo = crud.get_photo(db, photo_id=photo_id)
     return photo
 
+@router.get("/photos/{photo_id}/{kind}", response_class=FileResponse)
+def read_photo_derivative(photo_id: int, kind: str, db: Session = Depends(get_db)):
+    """Get a resized copy of a photo ("thumbnail" or "preview"), rebuilding it if missing"""
+    if kind not in PHOTO_DERIVATIVE_SIZES:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown photo size")
+    
+    photo = crud.get_photo(db, photo_id=photo_id)
+    if not os.path.exists(photo.photo_path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo file not found")
+    
+    # Fall back to the original if it cannot be resized
+    path = get_photo_derivative(photo.photo_path, kind) or photo.photo_path
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=86400"})
+
 @router.put("/photos/{photo_id}", response_model=schemas.Photo)
 def update_photo(
     photo_id: int, 
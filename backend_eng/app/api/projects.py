@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Header, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from app.db.database import get_db
 from app.services import crud
 from app.schemas import schemas
 from app.utils.file_utils import calculate_project_files_size
+from app.utils.pagination import next_cursor, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 router = APIRouter()
 
@@ -13,19 +14,19 @@ def create_project(project: schemas.ProjectCreate, db: Session = Depends(get_db)
     """Create a new project"""
     return crud.create_project(db=db, project=project)
 
-@router.get("/projects/", response_model=List[schemas.Project])
+@router.get("/projects/", response_model=schemas.Page[schemas.Project])
 def read_projects(
-    skip: int = 0, 
-    limit: int = 100, 
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     owner: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """Get all projects, optionally filtered by owner"""
+    """Get a page of projects, optionally filtered by owner; pass next_cursor to get the next page"""
     if owner:
-        projects = crud.get_projects_by_owner(db, owner=owner, skip=skip, limit=limit)
+        projects = crud.get_projects_by_owner(db, owner=owner, limit=limit, cursor=cursor)
     else:
-        projects = crud.get_projects(db, skip=skip, limit=limit)
-    return projects
+        projects = crud.get_projects(db, limit=limit, cursor=cursor)
+    return {"items": projects, "next_cursor": next_cursor(projects, crud.PROJECT_SORT, limit)}
 
 @router.get("/projects/{project_id}", response_model=schemas.ProjectWithInspections)
 def read_project(
@@ -34,7 +35,25 @@ def read_project(
     db: Session = Depends(get_db)
 ):
     """Get a specific project by ID with its inspections"""
-    project = crud.get_project(db, project_id=project_id)
+    project = crud.get_project_with_inspections(db, project_id=project_id)
+    
+    # If owner is provided, verify it matches the project owner
+    if owner and project.owner != owner:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied: You are not the owner of this project"
+        )
+    
+    return project
+
+@router.get("/projects/{project_id}/tree", response_model=schemas.ProjectTree)
+def read_project_tree(
+    project_id: int, 
+    owner: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """Get a project with all of its inspections and their photos"""
+    project = crud.get_project_tree(db, project_id=project_id)
     
     # If owner is provided, verify it matches the project owner
     if owner and project.owner != owner:
@@ -99,10 +118,11 @@ def update_project(
 @router.delete("/projects/{project_id}", response_model=schemas.Project)
 def delete_project(
     project_id: int, 
+    background_tasks: BackgroundTasks,
     owner: str = Header(...),
     db: Session = Depends(get_db)
 ):
-    """Delete a project"""
+    """Delete a project; its files are removed after the response is sent"""
     # Get the existing project
     existing_project = crud.get_project(db, project_id=project_id)
     
@@ -113,4 +133,4 @@ def delete_project(
             detail="Access denied: You are not the owner of this project"
         )
     
-    return crud.delete_project(db=db, project_id=project_id)
+    return crud.delete_project(db=db, project_id=project_id, background_tasks=background_tasks)
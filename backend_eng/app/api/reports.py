@@ -0,0 +1,36 @@
+from datetime import datetime
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sqlalchemy.orm import Session
+from app.db.database import get_db
+from app.services import crud
+from app.services.jobs import run_in_render_pool
+from app.schemas import schemas
+from app.utils.report_utils import build_merged_report, iter_file_chunks, delete_report_file
+
+router = APIRouter()
+
+@router.post("/reports/merged", response_class=StreamingResponse)
+def create_merged_report(batch: schemas.InspectionBatchRequest, db: Session = Depends(get_db)):
+    """
+    Build one PDF report for several inspections and stream it back.
+    
+    For each inspection, in the order given, the uploaded form is followed by its
+    photo pages. The report is built from the files on disk in the render pool and
+    sent in chunks. A background task deletes it when the response ends, also when
+    the client disconnects before the body is streamed.
+    """
+    inspections = crud.get_inspections_with_photos(db, inspection_ids=batch.ids)
+    
+    # Snapshot the rows into plain schemas so they can be pickled to the render process
+    inspections_data = [schemas.InspectionWithPhotos.model_validate(inspection) for inspection in inspections]
+    report_path = run_in_render_pool(build_merged_report, inspections_data)
+    
+    filename = f"inspection_report_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
+    return StreamingResponse(
+        iter_file_chunks(report_path),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        background=BackgroundTask(delete_report_file, report_path)
+    )
@@ -1,6 +1,10 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 import os
+from app.services.metrics import DB_POOL_CHECKOUT_TIMEOUTS, instrument_pool, instrument_sessions
 
 # Get database URL from environment variable or use default
 # SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/app.db")
@@ -15,15 +19,65 @@ if SQLALCHEMY_DATABASE_URL.startswith("sqlite:///") and not SQLALCHEMY_DATABASE_
     # Create the directory
     os.makedirs(db_dir, exist_ok=True)
 
-# Create engine with the appropriate connect_args for SQLite
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,
-    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
-)
+# Async driver of each database backend, used by the async request handlers
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "mysql": "aiomysql"}
+
+def async_database_url(url: str) -> str:
+    """Return the URL of the same database with the async driver of its backend"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for {backend} databases, set ASYNC_DATABASE_URL")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+# Same database as DATABASE_URL unless set, e.g. mysql+asyncmy://... to use asyncmy instead of aiomysql
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(SQLALCHEMY_DATABASE_URL)
+
+# Connection pool settings (ignored for SQLite); each API worker process has its own pool,
+# one for the sync engine and one for the async engine
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections older than this many seconds are replaced on checkout, -1 disables recycling
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))
+# Test every connection with a round-trip on checkout; with a recycle time below the
+# server's idle timeout (MySQL wait_timeout) this can be turned off
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+def _engine_options(url: str) -> dict:
+    """Return the create_engine arguments for a database URL"""
+    if url.startswith("sqlite"):
+        return {"pool_pre_ping": DB_POOL_PRE_PING, "connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+# Create engine with the pool settings above, or the connect_args for SQLite
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
+# Export the pool usage on /metrics
+instrument_pool(engine)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_sessions(SessionLocal)
+
+# Async engine and session factory for the async request handlers. Objects are not
+# expired on commit, as reloading an attribute would need an await.
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+instrument_pool(async_engine.sync_engine)
+
+class AsyncSessionBase(Session):
+    """Session class proxied by AsyncSessionLocal's sessions, so their events can be told apart"""
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False, sync_session_class=AsyncSessionBase
+)
+instrument_sessions(AsyncSessionBase)
 
 # Create declarative base
 Base = declarative_base()
@@ -33,17 +87,17 @@ def get_db():
     db = SessionLocal()
     try:
         yield db
+    except PoolTimeoutError:
+        DB_POOL_CHECKOUT_TIMEOUTS.inc()
+        raise
     finally:
         db.close()
 
-#def create_tables():
- #   """Create all tables in the database"""
-    # The directory creation is now handled when the module is loaded
-    # Create all tables
-   # Base.metadata.create_all(bind=engine,checkfirst=True)
-def create_tables():
-   """Create all tables in the database."""
-   try:
-        Base.metadata.create_all(bind=engine, checkfirst=True)
-   except Exception as e:
-       print(f"[WARNING] Skipping table creation due to error: {e}")
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except PoolTimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
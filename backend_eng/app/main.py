@@ -4,18 +4,17 @@ from fastapi.staticfiles import StaticFiles
 import os
 
 # Import the routers
-from app.api import projects, inspections, photos
+from app.api import projects, inspections, photos, jobs, reports
+from app.db.database import async_engine
+from app.services.jobs import shutdown_executor
+from app.services.metrics import MetricsMiddleware, metrics_response
 
 # Create necessary directories first
 os.makedirs("app/data", exist_ok=True)
 os.makedirs("app/static/uploads/pdfs", exist_ok=True)
 os.makedirs("app/static/uploads/photos", exist_ok=True)
 
-# Import database components for initialization
-from app.db.database import create_tables
-
-# Initialize database tables
-create_tables()
+# The schema is created and upgraded by the Alembic migrations (python migrate_db.py)
 
 # Create the FastAPI app
 app = FastAPI(
@@ -33,6 +32,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Record request count, latency, response size and SQL queries per route
+app.add_middleware(MetricsMiddleware, fastapi_app=app)
+
 # Mount static files
 os.makedirs("app/static", exist_ok=True)
 app.mount("/app/static", StaticFiles(directory="app/static"), name="static")
@@ -41,6 +43,21 @@ app.mount("/app/static", StaticFiles(directory="app/static"), name="static")
 app.include_router(projects.router, prefix="/api", tags=["projects"])
 app.include_router(inspections.router, prefix="/api", tags=["inspections"])
 app.include_router(photos.router, prefix="/api", tags=["photos"])
+app.include_router(jobs.router, prefix="/api", tags=["jobs"])
+app.include_router(reports.router, prefix="/api", tags=["reports"])
+
+@app.on_event("shutdown")
+def stop_render_workers():
+    shutdown_executor()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics of all worker processes"""
+    return metrics_response()
 
 @app.get("/")
 async def root():
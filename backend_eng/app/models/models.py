@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Enum, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Text, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -14,6 +14,9 @@ class ResultEnum(enum.Enum):
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        Index("ix_projects_owner_id", "owner", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=False)
@@ -22,35 +25,67 @@ class Project(Base):
     start_date = Column(Date, nullable=False)
     end_date = Column(Date, nullable=False)
     owner = Column(String(100), nullable=False)
+    storage_bytes = Column(BigInteger, nullable=False, default=0, server_default="0")
     
-    inspections = relationship("ConstructionInspection", back_populates="project")
+    inspections = relationship(
+        "ConstructionInspection",
+        back_populates="project",
+        order_by="[ConstructionInspection.inspection_date, ConstructionInspection.id]"
+    )
 
 class ConstructionInspection(Base):
     __tablename__ = "construction_inspections"
+    __table_args__ = (
+        Index("ix_construction_inspections_project_id_inspection_date", "project_id", "inspection_date"),
+        Index(
+            "ix_construction_inspections_project_id_form_sequence",
+            "project_id", "inspection_form_name", "inspection_sequence"
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=False)
     subproject_name = Column(String(200), nullable=False)
     inspection_form_name = Column(String(200), nullable=False)
+    # 1-based count of the inspections of this form in the project, assigned on creation
+    inspection_sequence = Column(Integer, nullable=False, default=1, server_default="1")
     inspection_date = Column(Date, nullable=False)
     location = Column(String(200), nullable=False)
     timing = Column(String(20), nullable=False)
     result = Column(String(20), nullable=False)
     remark = Column(Text, nullable=True)
-    pdf_path = Column(String(255), nullable=True)
+    pdf_path = Column(String(255), nullable=True, index=True)
+    pdf_size = Column(BigInteger, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     project = relationship("Project", back_populates="inspections")
-    photos = relationship("InspectionPhoto", back_populates="inspection", cascade="all, delete-orphan")
+    photos = relationship(
+        "InspectionPhoto",
+        back_populates="inspection",
+        cascade="all, delete-orphan",
+        order_by="InspectionPhoto.id"
+    )
 
 class InspectionPhoto(Base):
     __tablename__ = "inspection_photos"
     
     id = Column(Integer, primary_key=True, index=True)
-    inspection_id = Column(Integer, ForeignKey("construction_inspections.id"), nullable=False)
-    photo_path = Column(String(255), nullable=False)
+    inspection_id = Column(Integer, ForeignKey("construction_inspections.id"), nullable=False, index=True)
+    photo_path = Column(String(255), nullable=False, index=True)
     capture_date = Column(Date, nullable=False)
     caption = Column(String(255), nullable=True)
+    file_size = Column(BigInteger, nullable=False, default=0, server_default="0")
     
     inspection = relationship("ConstructionInspection", back_populates="photos")
+
+class RenderJob(Base):
+    __tablename__ = "render_jobs"
+    
+    id = Column(String(36), primary_key=True)
+    inspection_id = Column(Integer, ForeignKey("construction_inspections.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    pdf_path = Column(String(255), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -1,7 +1,14 @@
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, computed_field
+from typing import List, Optional, Generic, TypeVar
 from datetime import date, datetime
 
+T = TypeVar("T")
+
+# Paginated listing envelope
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
 # Project schemas
 class ProjectBase(BaseModel):
     name: str
@@ -33,6 +40,9 @@ class InspectionBase(BaseModel):
 class InspectionCreate(InspectionBase):
     pass
 
+class InspectionBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=500)
+
 class InspectionUpdate(BaseModel):
     result: str
     remark: Optional[str] = None
@@ -42,6 +52,7 @@ class InspectionUpdate(BaseModel):
 
 class Inspection(InspectionBase):
     id: int
+    inspection_sequence: int
     pdf_path: Optional[str] = None
     created_at: datetime
     updated_at: datetime
@@ -69,6 +80,23 @@ class Photo(PhotoBase):
     id: int
     
     model_config = ConfigDict(from_attributes=True)
+    
+    @computed_field
+    @property
+    def thumbnail_url(self) -> str:
+        return f"api/photos/{self.id}/thumbnail"
+    
+    @computed_field
+    @property
+    def preview_url(self) -> str:
+        return f"api/photos/{self.id}/preview"
+
+class PhotoWithInspection(Photo):
+    """A photo with the context of its inspection, as listed in the gallery"""
+    project_id: int
+    inspection_form_name: str
+    location: str
+    inspection_sequence: int
 
 # Response schemas
 class InspectionWithPhotos(Inspection):
@@ -80,3 +108,23 @@ class ProjectWithInspections(Project):
     inspections: List[Inspection] = []
     
     model_config = ConfigDict(from_attributes=True)
+
+class ProjectTree(Project):
+    inspections: List[InspectionWithPhotos] = []
+    
+    model_config = ConfigDict(from_attributes=True)
+
+class PdfPages(BaseModel):
+    page_count: int
+
+# Render job schemas
+class RenderJob(BaseModel):
+    id: str
+    inspection_id: int
+    status: str
+    pdf_path: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,87 @@
+"""
+Async versions of the crud operations of the async request handlers.
+
+They run on an AsyncSession, so the database round-trips are awaited on the
+event loop instead of blocking it. Storage accounting follows app.services.crud;
+releasing replaced files takes the blocking storage lock, so it runs in the
+thread pool in its own session.
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from app.models.models import Project, ConstructionInspection, InspectionPhoto
+from app.schemas import schemas
+from app.services.crud import release_files_task
+from app.utils.file_utils import get_file_size
+
+async def adjust_project_storage(db: AsyncSession, project_id: int, delta: int):
+    """Add delta bytes to a project's running storage total (committed by the caller)"""
+    if delta:
+        await db.execute(
+            update(Project)
+            .where(Project.id == project_id)
+            .values(storage_bytes=Project.storage_bytes + delta)
+            .execution_options(synchronize_session=False)
+        )
+
+async def get_inspection(db: AsyncSession, inspection_id: int):
+    inspection = await db.scalar(select(ConstructionInspection).where(ConstructionInspection.id == inspection_id))
+    if not inspection:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Inspection not found")
+    return inspection
+
+async def next_inspection_sequence(db: AsyncSession, project_id: int, inspection_form_name: str) -> int:
+    """Return the sequence number for a new inspection of a form in a project"""
+    # Lock the project row so concurrent creates in one project get distinct numbers
+    await db.execute(select(Project.id).where(Project.id == project_id).with_for_update())
+    highest = await db.scalar(
+        select(func.max(ConstructionInspection.inspection_sequence))
+        .where(
+            ConstructionInspection.project_id == project_id,
+            ConstructionInspection.inspection_form_name == inspection_form_name
+        )
+    )
+    return (highest or 0) + 1
+
+async def create_inspection(db: AsyncSession, inspection: schemas.InspectionCreate):
+    db_inspection = ConstructionInspection(
+        **inspection.model_dump(),
+        inspection_sequence=await next_inspection_sequence(db, inspection.project_id, inspection.inspection_form_name)
+    )
+    db.add(db_inspection)
+    await db.commit()
+    await db.refresh(db_inspection)
+    return db_inspection
+
+async def update_inspection(db: AsyncSession, inspection_id: int, inspection_update: schemas.InspectionUpdate):
+    db_inspection = await get_inspection(db, inspection_id)
+    
+    update_data = inspection_update.model_dump(exclude_unset=True)
+    
+    # Keep the stored size of the PDF and the project total in step with the file
+    old_pdf_path = db_inspection.pdf_path
+    if 'pdf_path' in update_data and update_data['pdf_path'] != old_pdf_path:
+        pdf_size = get_file_size(update_data['pdf_path']) if update_data['pdf_path'] else 0
+        await adjust_project_storage(db, db_inspection.project_id, pdf_size - db_inspection.pdf_size)
+        db_inspection.pdf_size = pdf_size
+    
+    for key, value in update_data.items():
+        setattr(db_inspection, key, value)
+    await db.commit()
+    
+    # If the PDF was replaced, delete the old one unless something else still uses it
+    if update_data.get('pdf_path') is not None and old_pdf_path != db_inspection.pdf_path:
+        await run_in_threadpool(release_files_task, [old_pdf_path])
+    
+    await db.refresh(db_inspection)
+    return db_inspection
+
+async def create_photo(db: AsyncSession, photo: schemas.PhotoCreate):
+    db_photo = InspectionPhoto(**photo.model_dump(), file_size=get_file_size(photo.photo_path))
+    db.add(db_photo)
+    inspection = await get_inspection(db, photo.inspection_id)
+    await adjust_project_storage(db, inspection.project_id, db_photo.file_size)
+    await db.commit()
+    await db.refresh(db_photo)
+    return db_photo
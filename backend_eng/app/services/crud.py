@@ -1,25 +1,109 @@
-from sqlalchemy.orm import Session
-from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session, selectinload
+from fastapi import BackgroundTasks, HTTPException, status
 from typing import List, Optional
-from app.models.models import Project, ConstructionInspection, InspectionPhoto
+from app.db.database import SessionLocal
+from app.models.models import Project, ConstructionInspection, InspectionPhoto, RenderJob
 from app.schemas import schemas
+from app.utils.file_utils import delete_photo_derivatives, get_file_size, storage_lock, is_pinned
+from app.utils.pdf_preview import delete_pdf_page_previews
+from app.utils.report_images import delete_report_images
+from app.utils.pagination import keyset_filter, DEFAULT_PAGE_SIZE
 from datetime import date
 import os
+import uuid
+
+def adjust_project_storage(db: Session, project_id: int, delta: int):
+    """Add delta bytes to a project's running storage total (committed by the caller)"""
+    if delta:
+        db.query(Project).filter(Project.id == project_id).update(
+            {Project.storage_bytes: Project.storage_bytes + delta},
+            synchronize_session=False
+        )
+
+def unreferenced_files(db: Session, paths) -> List[str]:
+    """Return the paths that no photo or inspection refers to any more, in two queries"""
+    paths = set(filter(None, paths))
+    if not paths:
+        return []
+    referenced = {path for (path,) in db.query(InspectionPhoto.photo_path).filter(InspectionPhoto.photo_path.in_(paths))}
+    referenced.update(path for (path,) in db.query(ConstructionInspection.pdf_path).filter(ConstructionInspection.pdf_path.in_(paths)))
+    return sorted(paths - referenced)
+
+def delete_stored_files(paths):
+    """Delete stored files with their cached copies, without checking whether they are still used"""
+    for path in paths:
+        if path.lower().endswith(".pdf"):
+            delete_pdf_page_previews(path)
+        else:
+            delete_report_images(path)
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except (OSError, PermissionError) as e:
+                # Log the error but continue, the database change is already done
+                print(f"Error deleting file {path}: {e}")
+        delete_photo_derivatives(path)
+
+def release_files(db: Session, paths):
+    """
+    Delete stored files that are no longer referenced by any photo or inspection.
+    
+    Uploads are stored once per content and shared between rows, so call this
+    after the rows that referred to the paths have been changed or deleted.
+    The references are checked under the storage lock right before deleting,
+    and files pinned by an upload whose row is not committed yet are kept.
+    """
+    with storage_lock():
+        delete_stored_files([path for path in unreferenced_files(db, paths) if not is_pinned(path)])
+
+def release_files_task(paths):
+    """Release files from a background task, in its own session (the request's one may be closed by then)"""
+    with SessionLocal() as db:
+        release_files(db, paths)
+
+# Sort keys of the paginated listings; each ends with the primary key so it is unique
+PROJECT_SORT = [Project.id]
+INSPECTION_SORT = [ConstructionInspection.inspection_date, ConstructionInspection.id]
+INSPECTION_SEQUENCE_SORT = [
+    ConstructionInspection.inspection_form_name,
+    ConstructionInspection.inspection_sequence,
+    ConstructionInspection.id
+]
+PHOTO_SORT = [InspectionPhoto.id]
+
+def paginate(query, sort_columns: list, limit: int, cursor: Optional[str] = None):
+    """Return the page of rows after the cursor, ordered by sort_columns"""
+    if cursor:
+        query = query.filter(keyset_filter(sort_columns, cursor))
+    return query.order_by(*sort_columns).limit(limit).all()
 
 # Project CRUD operations
-def get_projects(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Project).offset(skip).limit(limit).all()
+def get_projects(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
+    return paginate(db.query(Project), PROJECT_SORT, limit, cursor)
 
-def get_projects_by_owner(db: Session, owner: str, skip: int = 0, limit: int = 100):
+def get_projects_by_owner(db: Session, owner: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None):
     """Get projects filtered by owner"""
-    return db.query(Project).filter(Project.owner == owner).offset(skip).limit(limit).all()
+    return paginate(db.query(Project).filter(Project.owner == owner), PROJECT_SORT, limit, cursor)
 
-def get_project(db: Session, project_id: int):
-    project = db.query(Project).filter(Project.id == project_id).first()
+def get_project(db: Session, project_id: int, *options):
+    project = db.query(Project).options(*options).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     return project
 
+def get_project_with_inspections(db: Session, project_id: int):
+    """Get a project with its inspections loaded in one extra query"""
+    return get_project(db, project_id, selectinload(Project.inspections))
+
+def get_project_tree(db: Session, project_id: int):
+    """Get a project with its inspections and their photos in three queries in total"""
+    return get_project(
+        db,
+        project_id,
+        selectinload(Project.inspections).selectinload(ConstructionInspection.photos)
+    )
+
 def create_project(db: Session, project: schemas.ProjectCreate):
     db_project = Project(**project.model_dump())
     db.add(db_project)
@@ -35,34 +119,117 @@ def update_project(db: Session, project_id: int, project: schemas.ProjectCreate)
     db.refresh(db_project)
     return db_project
 
-def delete_project(db: Session, project_id: int):
-    db_project = get_project(db, project_id)
+def delete_project(db: Session, project_id: int, background_tasks: Optional[BackgroundTasks] = None) -> schemas.Project:
+    """
+    Delete a project with its inspections and photos in one transaction.
+    
+    Photos, inspections and the project are removed with one DELETE statement
+    each. The files that no other row refers to are released afterwards, by
+    background_tasks when given (after the response is sent), otherwise right away.
+    
+    Returns:
+        A snapshot of the deleted project
+    """
+    deleted_project = schemas.Project.model_validate(get_project(db, project_id))
     
-    # Get all inspections for this project to delete their files
-    inspections = db.query(ConstructionInspection).filter(ConstructionInspection.project_id == project_id).all()
-    for inspection in inspections:
-        # Delete inspection files (including associated photos)
-        delete_inspection(db, inspection.id)
+    project_inspections = db.query(ConstructionInspection.id).filter(ConstructionInspection.project_id == project_id)
+    inspection_rows = db.query(ConstructionInspection.id, ConstructionInspection.pdf_path).filter(
+        ConstructionInspection.project_id == project_id
+    ).all()
+    inspection_ids = {inspection_id for inspection_id, _ in inspection_rows}
+    paths = [pdf_path for _, pdf_path in inspection_rows if pdf_path]
+    paths += [path for (path,) in db.query(InspectionPhoto.photo_path).filter(
+        InspectionPhoto.inspection_id.in_(project_inspections.scalar_subquery())
+    )]
     
-    db.delete(db_project)
+    # Objects of these rows that the session already holds are detached with their
+    # state loaded, as an ORM delete would leave them, so callers can still read them
+    in_session = [
+        obj for obj in list(db.identity_map.values())
+        if (isinstance(obj, Project) and obj.id == project_id)
+        or (isinstance(obj, ConstructionInspection) and obj.id in inspection_ids)
+        or (isinstance(obj, InspectionPhoto) and obj.inspection_id in inspection_ids)
+    ]
+    
+    db.query(InspectionPhoto).filter(
+        InspectionPhoto.inspection_id.in_(project_inspections.scalar_subquery())
+    ).delete(synchronize_session=False)
+    db.query(ConstructionInspection).filter(ConstructionInspection.project_id == project_id).delete(synchronize_session=False)
+    db.query(Project).filter(Project.id == project_id).delete(synchronize_session=False)
+    for obj in in_session:
+        db.expunge(obj)
     db.commit()
-    return db_project
+    # Drop any other state that may refer to the deleted rows
+    db.expire_all()
+    
+    # Delete the PDF and photo files that no other row refers to when the task runs
+    if background_tasks is not None:
+        background_tasks.add_task(release_files_task, paths)
+    else:
+        release_files(db, paths)
+    return deleted_project
 
 # Inspection CRUD operations
-def get_inspections(db: Session, skip: int = 0, limit: int = 100, project_id: Optional[int] = None):
+def get_inspections(
+    db: Session,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    project_id: Optional[int] = None,
+    inspection_form_name: Optional[str] = None,
+    inspection_sequence: Optional[int] = None,
+    sort_columns: list = INSPECTION_SORT
+):
     query = db.query(ConstructionInspection)
     if project_id:
         query = query.filter(ConstructionInspection.project_id == project_id)
-    return query.offset(skip).limit(limit).all()
+    if inspection_form_name:
+        query = query.filter(ConstructionInspection.inspection_form_name == inspection_form_name)
+    if inspection_sequence:
+        query = query.filter(ConstructionInspection.inspection_sequence == inspection_sequence)
+    return paginate(query, sort_columns, limit, cursor)
 
-def get_inspection(db: Session, inspection_id: int):
-    inspection = db.query(ConstructionInspection).filter(ConstructionInspection.id == inspection_id).first()
+def get_inspection(db: Session, inspection_id: int, *options):
+    inspection = db.query(ConstructionInspection).options(*options).filter(ConstructionInspection.id == inspection_id).first()
     if not inspection:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Inspection not found")
     return inspection
 
+def get_inspection_with_photos(db: Session, inspection_id: int):
+    """Get an inspection with its photos loaded in one extra query"""
+    return get_inspection(db, inspection_id, selectinload(ConstructionInspection.photos))
+
+def get_inspections_with_photos(db: Session, inspection_ids: List[int]):
+    """Get several inspections with their photos, in the order of inspection_ids"""
+    inspections = (
+        db.query(ConstructionInspection)
+        .options(selectinload(ConstructionInspection.photos))
+        .filter(ConstructionInspection.id.in_(set(inspection_ids)))
+        .all()
+    )
+    by_id = {inspection.id: inspection for inspection in inspections}
+    if len(by_id) != len(set(inspection_ids)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Inspection not found")
+    return [by_id[inspection_id] for inspection_id in inspection_ids]
+
+def next_inspection_sequence(db: Session, project_id: int, inspection_form_name: str) -> int:
+    """Return the sequence number for a new inspection of a form in a project"""
+    # Lock the project row so concurrent creates in one project get distinct numbers
+    db.query(Project.id).filter(Project.id == project_id).with_for_update().first()
+    highest = (
+        db.query(func.max(ConstructionInspection.inspection_sequence))
+        .filter(
+            ConstructionInspection.project_id == project_id,
+            ConstructionInspection.inspection_form_name == inspection_form_name
+        )
+        .scalar()
+    )
+    return (highest or 0) + 1
+
 def create_inspection(db: Session, inspection: schemas.InspectionCreate):
-    db_inspection = ConstructionInspection(**inspection.model_dump())
+    db_inspection = ConstructionInspection(
+        **inspection.model_dump(),
+        inspection_sequence=next_inspection_sequence(db, inspection.project_id, inspection.inspection_form_name)
+    )
     db.add(db_inspection)
     db.commit()
     db.refresh(db_inspection)
@@ -71,54 +238,76 @@ def create_inspection(db: Session, inspection: schemas.InspectionCreate):
 def update_inspection(db: Session, inspection_id: int, inspection_update: schemas.InspectionUpdate):
     db_inspection = get_inspection(db, inspection_id)
     
-    # If updating the PDF path and there's an existing PDF, delete the old one
     update_data = inspection_update.model_dump(exclude_unset=True)
-    if 'pdf_path' in update_data and update_data['pdf_path'] is not None and db_inspection.pdf_path:
-        if os.path.exists(db_inspection.pdf_path):
-            try:
-                os.remove(db_inspection.pdf_path)
-            except (OSError, PermissionError) as e:
-                # Log the error but continue with the update
-                print(f"Error deleting PDF file {db_inspection.pdf_path}: {e}")
+    
+    # Keep the stored size of the PDF and the project total in step with the file
+    old_pdf_path = db_inspection.pdf_path
+    if 'pdf_path' in update_data and update_data['pdf_path'] != old_pdf_path:
+        pdf_size = get_file_size(update_data['pdf_path']) if update_data['pdf_path'] else 0
+        adjust_project_storage(db, db_inspection.project_id, pdf_size - db_inspection.pdf_size)
+        db_inspection.pdf_size = pdf_size
     
     for key, value in update_data.items():
         setattr(db_inspection, key, value)
     db.commit()
+    
+    # If the PDF was replaced, delete the old one unless something else still uses it
+    if update_data.get('pdf_path') is not None and old_pdf_path != db_inspection.pdf_path:
+        release_files(db, [old_pdf_path])
+    
     db.refresh(db_inspection)
     return db_inspection
 
 def delete_inspection(db: Session, inspection_id: int):
     db_inspection = get_inspection(db, inspection_id)
     
-    # Delete the PDF file if it exists
-    if db_inspection.pdf_path and os.path.exists(db_inspection.pdf_path):
-        try:
-            os.remove(db_inspection.pdf_path)
-        except (OSError, PermissionError) as e:
-            # Log the error but continue with the deletion
-            print(f"Error deleting PDF file {db_inspection.pdf_path}: {e}")
-    
-    # Get all photos for this inspection to delete their files
+    # Get all photos for this inspection, they are deleted with it
     photos = db.query(InspectionPhoto).filter(InspectionPhoto.inspection_id == inspection_id).all()
-    for photo in photos:
-        # Delete photo files
-        if photo.photo_path and os.path.exists(photo.photo_path):
-            try:
-                os.remove(photo.photo_path)
-            except (OSError, PermissionError) as e:
-                # Log the error but continue with the deletion
-                print(f"Error deleting photo file {photo.photo_path}: {e}")
+    paths = [db_inspection.pdf_path] + [photo.photo_path for photo in photos]
+    
+    freed = db_inspection.pdf_size + sum(photo.file_size for photo in photos)
+    adjust_project_storage(db, db_inspection.project_id, -freed)
     
     db.delete(db_inspection)
     db.commit()
+    
+    # Delete the PDF and photo files that no other row refers to
+    release_files(db, paths)
     return db_inspection
 
 # Photo CRUD operations
-def get_photos(db: Session, skip: int = 0, limit: int = 100, inspection_id: Optional[int] = None):
+def get_photos(db: Session, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, inspection_id: Optional[int] = None):
     query = db.query(InspectionPhoto)
     if inspection_id:
         query = query.filter(InspectionPhoto.inspection_id == inspection_id)
-    return query.offset(skip).limit(limit).all()
+    return paginate(query, PHOTO_SORT, limit, cursor)
+
+def get_photos_with_inspection(
+    db: Session,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    inspection_id: Optional[int] = None,
+    project_id: Optional[int] = None,
+    inspection_form_name: Optional[str] = None,
+    inspection_sequence: Optional[int] = None
+):
+    """Get a page of photos joined with the context of their inspection"""
+    query = db.query(
+        *InspectionPhoto.__table__.columns,
+        ConstructionInspection.project_id,
+        ConstructionInspection.inspection_form_name,
+        ConstructionInspection.location,
+        ConstructionInspection.inspection_sequence
+    ).join(ConstructionInspection, ConstructionInspection.id == InspectionPhoto.inspection_id)
+    if inspection_id:
+        query = query.filter(InspectionPhoto.inspection_id == inspection_id)
+    if project_id:
+        query = query.filter(ConstructionInspection.project_id == project_id)
+    if inspection_form_name:
+        query = query.filter(ConstructionInspection.inspection_form_name == inspection_form_name)
+    if inspection_sequence:
+        query = query.filter(ConstructionInspection.inspection_sequence == inspection_sequence)
+    return paginate(query, PHOTO_SORT, limit, cursor)
 
 def get_photo(db: Session, photo_id: int):
     photo = db.query(InspectionPhoto).filter(InspectionPhoto.id == photo_id).first()
@@ -127,8 +316,9 @@ def get_photo(db: Session, photo_id: int):
     return photo
 
 def create_photo(db: Session, photo: schemas.PhotoCreate):
-    db_photo = InspectionPhoto(**photo.model_dump())
+    db_photo = InspectionPhoto(**photo.model_dump(), file_size=get_file_size(photo.photo_path))
     db.add(db_photo)
+    adjust_project_storage(db, get_inspection(db, photo.inspection_id).project_id, db_photo.file_size)
     db.commit()
     db.refresh(db_photo)
     return db_photo
@@ -136,33 +326,56 @@ def create_photo(db: Session, photo: schemas.PhotoCreate):
 def update_photo(db: Session, photo_id: int, photo_update: schemas.PhotoUpdate):
     db_photo = get_photo(db, photo_id)
     
-    # If updating the photo path and there's an existing photo, delete the old one
     update_data = photo_update.model_dump(exclude_unset=True)
-    if 'photo_path' in update_data and update_data['photo_path'] is not None and db_photo.photo_path:
-        if os.path.exists(db_photo.photo_path):
-            try:
-                os.remove(db_photo.photo_path)
-            except (OSError, PermissionError) as e:
-                # Log the error but continue with the update
-                print(f"Error deleting photo file {db_photo.photo_path}: {e}")
+    
+    # Keep the stored size of the photo and the project total in step with the file
+    old_photo_path = db_photo.photo_path
+    if update_data.get('photo_path') is not None and update_data['photo_path'] != old_photo_path:
+        file_size = get_file_size(update_data['photo_path'])
+        adjust_project_storage(db, db_photo.inspection.project_id, file_size - db_photo.file_size)
+        db_photo.file_size = file_size
     
     for key, value in update_data.items():
         setattr(db_photo, key, value)
     db.commit()
+    
+    # If the photo was replaced, delete the old one unless something else still uses it
+    if old_photo_path != db_photo.photo_path:
+        release_files(db, [old_photo_path])
+    
     db.refresh(db_photo)
     return db_photo
 
 def delete_photo(db: Session, photo_id: int):
     db_photo = get_photo(db, photo_id)
     
-    # Delete the photo file if it exists
-    if db_photo.photo_path and os.path.exists(db_photo.photo_path):
-        try:
-            os.remove(db_photo.photo_path)
-        except (OSError, PermissionError) as e:
-            # Log the error but continue with the deletion
-            print(f"Error deleting photo file {db_photo.photo_path}: {e}")
+    adjust_project_storage(db, db_photo.inspection.project_id, -db_photo.file_size)
     
     db.delete(db_photo)
     db.commit()
+    
+    # Delete the photo file unless another photo or inspection still uses it
+    release_files(db, [db_photo.photo_path])
     return db_photo
+
+# Render job operations
+def get_render_job(db: Session, job_id: str):
+    job = db.query(RenderJob).filter(RenderJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+def create_render_job(db: Session, inspection_id: int):
+    db_job = RenderJob(id=str(uuid.uuid4()), inspection_id=inspection_id, status="pending")
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def update_render_job(db: Session, job_id: str, **fields):
+    db_job = get_render_job(db, job_id)
+    for key, value in fields.items():
+        setattr(db_job, key, value)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
@@ -0,0 +1,192 @@
+"""
+Background PDF rendering.
+
+ReportLab builds are CPU bound, so they run in a bounded process pool instead of
+on the worker's event loop. Job state is kept in the ``render_jobs`` table so a
+status poll can be answered by any gunicorn worker, not only the one that queued
+the build.
+"""
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from app.db.database import SessionLocal
+from app.services import crud
+from app.schemas import schemas
+from app.utils.file_utils import generate_inspection_pdf
+
+logger = logging.getLogger(__name__)
+
+# Number of render processes per API worker
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+# Maximum number of queued or running builds per API worker
+PDF_RENDER_MAX_PENDING = int(os.getenv("PDF_RENDER_MAX_PENDING", "16"))
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending_slots = threading.BoundedSemaphore(PDF_RENDER_MAX_PENDING)
+
+def get_executor():
+    """Return the process pool for this worker, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Use spawn so the children never inherit the server's threads or sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+def shutdown_executor():
+    """Stop the process pool, waiting for running builds to finish"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+def _discard_executor(executor):
+    """Drop a broken process pool so the next get_executor call starts a new one"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+def _submit(fn, *args):
+    """
+    Submit fn to the render process pool.
+    
+    Once a render process dies (e.g. killed for using too much memory) the pool
+    refuses all new work, so a broken pool is replaced and the submit retried once.
+    
+    Returns:
+        The executor the work was submitted to and the future of its result
+    """
+    executor = get_executor()
+    try:
+        return executor, executor.submit(fn, *args)
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        executor = get_executor()
+        return executor, executor.submit(fn, *args)
+
+def submit_pdf_render(db: Session, inspection, photos) -> schemas.RenderJob:
+    """
+    Queue a PDF build for an inspection and return the pending job.
+    
+    Args:
+        db: Database session
+        inspection: Inspection ORM object
+        photos: Photo ORM objects to embed in the report
+        
+    Returns:
+        The newly created render job
+    """
+    if not _pending_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many PDF reports are being generated, please retry later"
+        )
+    
+    try:
+        job = crud.create_render_job(db, inspection.id)
+    except Exception:
+        _pending_slots.release()
+        raise
+    
+    try:
+        # Snapshot the rows into plain schemas so they can be pickled to the child process
+        inspection_data = schemas.Inspection.model_validate(inspection)
+        photos_data = [schemas.Photo.model_validate(photo) for photo in photos]
+        
+        executor, future = _submit(generate_inspection_pdf, inspection_data, photos_data)
+    except Exception as e:
+        # The build never started, so no callback will finish the job
+        _pending_slots.release()
+        logger.exception("Error queueing render job %s", job.id)
+        return crud.update_render_job(db, job.id, status="failed", error=str(e))
+    
+    future.add_done_callback(partial(_finish_pdf_render, job.id, inspection.id, executor))
+    return job
+
+def run_in_render_pool(fn, *args):
+    """Run fn in the render process pool and wait for its result (call from a worker thread)"""
+    if not _pending_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many PDF reports are being generated, please retry later"
+        )
+    
+    try:
+        executor, future = _submit(fn, *args)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # The render process died while running fn
+            _discard_executor(executor)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The PDF renderer stopped unexpectedly, please retry later"
+            )
+    finally:
+        _pending_slots.release()
+
+def _finish_pdf_render(job_id: str, inspection_id: int, executor, future):
+    """Record the outcome of a build and attach the PDF to its inspection"""
+    try:
+        with SessionLocal() as db:
+            try:
+                pdf_path = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    _discard_executor(executor)
+                crud.update_render_job(db, job_id, status="failed", error=str(e))
+                return
+            
+            try:
+                inspection = crud.get_inspection(db, inspection_id=inspection_id)
+            except HTTPException:
+                # The inspection was deleted while its PDF was rendering
+                logger.warning("Inspection %s of render job %s was deleted, discarding %s", inspection_id, job_id, pdf_path)
+                _remove_file(pdf_path)
+                _mark_job_failed(job_id, "Inspection was deleted")
+                return
+            
+            inspection_update = schemas.InspectionUpdate(
+                result=inspection.result,
+                remark=inspection.remark,
+                pdf_path=pdf_path
+            )
+            crud.update_inspection(db, inspection_id, inspection_update)
+            crud.update_render_job(db, job_id, status="succeeded", pdf_path=pdf_path)
+    except Exception as e:
+        # The callback runs outside any request, so there is nobody to raise to
+        logger.exception("Error finishing render job %s", job_id)
+        _mark_job_failed(job_id, str(e))
+    finally:
+        _pending_slots.release()
+
+def _remove_file(path: str):
+    """Delete a rendered PDF that no inspection will refer to"""
+    try:
+        os.remove(path)
+    except OSError:
+        logger.exception("Error deleting rendered PDF %s", path)
+
+def _mark_job_failed(job_id: str, error: str):
+    """Mark a job failed in a new session, so it does not stay pending after an unexpected error"""
+    try:
+        with SessionLocal() as db:
+            crud.update_render_job(db, job_id, status="failed", error=error)
+    except HTTPException:
+        # The job was deleted along with its inspection
+        pass
+    except Exception:
+        logger.exception("Error marking render job %s as failed", job_id)
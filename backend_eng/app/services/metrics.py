@@ -0,0 +1,295 @@
+"""
+Prometheus metrics of the API.
+
+An ASGI middleware records, per route template, the request count, latency,
+in-flight requests, response size and the number and duration of the SQL
+queries run while handling the request. The metrics are served on /metrics in
+the Prometheus text format.
+
+With SQL_QUERY_DEBUG=true (development and tests) the statements of each request
+are also recorded: statements run at least SQL_REPEATED_QUERY_THRESHOLD times in
+one request, the usual sign of an N+1 pattern, are logged, and a query beyond
+SQL_QUERY_BUDGET (0 disables the limit) fails the request.
+
+The database connection pool is instrumented with its connect, checkout and
+checkin events: the pool size, checked-out and overflow connections, new
+connections, checkouts and how long connections are held. The time a session
+waits for its connection is measured from the start of its transaction to the
+moment the connection is bound to it, which includes waiting for a free pooled
+connection, opening a new one and the pre-ping.
+
+When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py), each worker
+process writes its values to that directory and /metrics aggregates them, so
+any worker can answer the scrape.
+"""
+import os
+import re
+import time
+import threading
+from collections import Counter as StatementCounter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    CONTENT_TYPE_LATEST,
+    REGISTRY
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.routing import Match
+from starlette.responses import Response
+
+# Opt-in recording of the statements of each request
+SQL_QUERY_DEBUG = os.getenv("SQL_QUERY_DEBUG", "false").lower() in ("1", "true", "yes")
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "0"))
+SQL_REPEATED_QUERY_THRESHOLD = int(os.getenv("SQL_REPEATED_QUERY_THRESHOLD", "3"))
+
+# Label of requests that did not match any route, to keep the label set bounded
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Number of HTTP requests",
+    ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of the response",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Number of HTTP requests being handled",
+    ["method", "route"],
+    multiprocess_mode="livesum"
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of the response bodies",
+    ["method", "route"],
+    buckets=(256, 1024, 16 * 1024, 128 * 1024, 1024 ** 2, 8 * 1024 ** 2, 64 * 1024 ** 2)
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Number of SQL queries run while handling a request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+REQUEST_DB_DURATION = Histogram(
+    "http_request_db_duration_seconds",
+    "Total time spent in SQL queries while handling a request",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured number of persistent connections in the pools",
+    multiprocess_mode="livesum"
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the pools",
+    multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Checked-out connections beyond the pool size",
+    multiprocess_mode="livesum"
+)
+DB_POOL_CONNECTS = Counter(
+    "db_pool_connects_total",
+    "New database connections opened by the pools"
+)
+DB_POOL_CHECKOUTS = Counter(
+    "db_pool_checkouts_total",
+    "Connections checked out of the pools"
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Requests that gave up waiting for a free connection"
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time a session waited for its connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+DB_CONNECTION_HOLD = Histogram(
+    "db_connection_hold_seconds",
+    "Time a connection stayed checked out of the pool",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more SQL queries than its budget"""
+
+def statement_shape(statement: str) -> str:
+    """Return a statement with whitespace collapsed and IN lists reduced to one placeholder"""
+    statement = " ".join(statement.split())
+    return re.sub(r"\((?:\s*(?:\?|%s|:\w+)\s*,)+\s*(?:\?|%s|:\w+)\s*\)", "(?)", statement)
+
+class QueryStats:
+    """
+    SQL queries run while handling one request.
+    
+    Args:
+        record_statements: Also count the queries by statement shape
+        budget: Maximum number of queries, 0 for no limit
+    """
+    def __init__(self, record_statements: bool = False, budget: int = 0):
+        self.count = 0
+        self.duration = 0.0
+        self.budget = budget
+        self.statements = StatementCounter() if record_statements else None
+    
+    def record(self, statement: str, elapsed: float):
+        self.count += 1
+        self.duration += elapsed
+        if self.statements is not None:
+            self.statements[statement_shape(statement)] += 1
+        if self.budget and self.count > self.budget:
+            raise QueryBudgetExceeded(f"More than {self.budget} SQL queries in one request\n{self.report()}")
+    
+    def repeated(self, threshold: int = SQL_REPEATED_QUERY_THRESHOLD) -> List[Tuple[str, int]]:
+        """Return the statement shapes run at least threshold times, most frequent first"""
+        if self.statements is None:
+            return []
+        return [(shape, count) for shape, count in self.statements.most_common() if count >= threshold]
+    
+    def report(self) -> str:
+        """Describe the queries and the repeated statements"""
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f} ms"]
+        lines.extend(f"  {count}x {shape}" for shape, count in self.repeated())
+        return "\n".join(lines)
+
+# Set by the middleware for each request. Sync endpoints run in the thread pool
+# with a copy of the context, so they update the same QueryStats object.
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_times")
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+def instrument_pool(engine: Engine):
+    """Record the usage of an engine's connection pool through its pool events"""
+    pool = engine.pool
+    size = pool.size() if isinstance(pool, QueuePool) else 0
+    DB_POOL_SIZE.inc(size)
+    # Connections of this pool currently checked out. The checkin event fires before
+    # the pool updates its own counts, so they are tracked here.
+    checked_out = [0]
+    lock = threading.Lock()
+
+    def update_checked_out(delta: int):
+        with lock:
+            overflow_before = max(checked_out[0] - size, 0) if size else 0
+            checked_out[0] += delta
+            overflow_after = max(checked_out[0] - size, 0) if size else 0
+        DB_POOL_CHECKED_OUT.inc(delta)
+        DB_POOL_OVERFLOW.inc(overflow_after - overflow_before)
+
+    @event.listens_for(pool, "connect")
+    def _count_connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTS.inc()
+
+    @event.listens_for(pool, "checkout")
+    def _record_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc()
+        connection_record.info["checkout_time"] = time.perf_counter()
+        update_checked_out(1)
+
+    @event.listens_for(pool, "checkin")
+    def _record_checkin(dbapi_connection, connection_record):
+        checkout_time = connection_record.info.pop("checkout_time", None)
+        if checkout_time is not None:
+            DB_CONNECTION_HOLD.observe(time.perf_counter() - checkout_time)
+            update_checked_out(-1)
+
+def instrument_sessions(session_factory):
+    """Record how long the sessions of a sessionmaker or Session class wait for their connection"""
+    @event.listens_for(session_factory, "after_transaction_create")
+    def _start_checkout_timer(session, transaction):
+        if transaction.parent is None:
+            session.info["checkout_start"] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_begin")
+    def _record_checkout_wait(session, transaction, connection):
+        start = session.info.pop("checkout_start", None)
+        if start is not None:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+def route_template(app, scope) -> str:
+    """Return the path template of the route a request is for, e.g. /api/projects/{project_id}"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    """ASGI middleware recording the metrics of every HTTP request"""
+    def __init__(self, app, fastapi_app):
+        self.app = app
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(self.fastapi_app, scope)
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        stats = QueryStats(record_statements=SQL_QUERY_DEBUG, budget=SQL_QUERY_BUDGET if SQL_QUERY_DEBUG else 0)
+        token = current_query_stats.set(stats)
+        in_progress = REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            in_progress.dec()
+            current_query_stats.reset(token)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+            RESPONSE_SIZE.labels(method, route).observe(response_size)
+            REQUEST_DB_QUERIES.labels(method, route).observe(stats.count)
+            REQUEST_DB_DURATION.labels(method, route).observe(stats.duration)
+            if stats.repeated():
+                print(f"Repeated SQL queries in {method} {route}: {stats.report()}")
+
+def metrics_response() -> Response:
+    """Return the current metrics in the Prometheus text format, aggregated over the worker processes"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,16 +1,20 @@
 import pytest
-from sqlalchemy import create_engine
+from contextlib import contextmanager, nullcontext
+from unittest.mock import patch
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 from app.db.database import Base
 from app.main import app
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
 import os
 import sys
 import shutil
 from datetime import date, timedelta
 from app.models.models import Project, ConstructionInspection, InspectionPhoto
 from app.schemas import schemas
+from app.services.metrics import QueryStats
 
 os.makedirs("app/data", exist_ok=True)  
 
@@ -56,14 +60,66 @@ def client(db):
         finally:
             pass  # 不在這裡關閉，由 db fixture 處理
     
+    # 非同步的 session 包裝同一個測試 session，讀寫同一個交易
+    async def override_get_async_db():
+        yield AsyncSession(sync_session_class=lambda **kw: db)
+    
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
     
-    with TestClient(app) as test_client:
+    # 背景工作自行開啟 session，同樣導向測試資料庫
+    with patch("app.services.crud.SessionLocal", lambda: nullcontext(db)), TestClient(app) as test_client:
         yield test_client
     
     # 重置依賴項覆蓋
     app.dependency_overrides = {}
 
+@pytest.fixture
+async def async_db(tmp_path):
+    """使用 aiosqlite 的非同步 session，資料庫檔案在測試結束後刪除"""
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async_test.db'}")
+    async with async_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    
+    async with async_sessionmaker(async_engine, expire_on_commit=False)() as session:
+        yield session
+    await async_engine.dispose()
+
+@pytest.fixture
+def query_counter(db):
+    """
+    計算測試資料庫執行的 SQL 查詢數，用法：
+    
+        with query_counter() as stats:
+            client.get(...)
+        assert stats.count == 2
+    """
+    @contextmanager
+    def count_queries():
+        stats = QueryStats(record_statements=True)
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            stats.record(statement, 0.0)
+        
+        event.listen(engine, "after_cursor_execute", record)
+        try:
+            yield stats
+        finally:
+            event.remove(engine, "after_cursor_execute", record)
+    
+    return count_queries
+
+@pytest.fixture
+def assert_max_queries(query_counter):
+    """確認區塊內的 SQL 查詢數不超過上限，超過時列出重複的查詢，用法：with assert_max_queries(3): ..."""
+    @contextmanager
+    def check(limit):
+        with query_counter() as stats:
+            yield stats
+        assert stats.count <= limit, f"Expected at most {limit} SQL queries, got {stats.report()}"
+    
+    return check
+
 # 設置測試用的上傳目錄
 TEST_PDF_DIR = "app/static/test_uploads/pdfs"
 TEST_PHOTO_DIR = "app/static/test_uploads/photos"
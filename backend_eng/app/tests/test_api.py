@@ -4,6 +4,8 @@ from datetime import date, timedelta
 import json
 from app.main import app
 import io
+import os
+from PIL import Image
 
 def test_read_main(client):
     """Test the root endpoint"""
@@ -11,6 +13,35 @@ def test_read_main(client):
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to Construction Inspection API"}
 
+def test_metrics(client, create_project_via_api):
+    """Test that requests are recorded per route template on /metrics"""
+    client.get(f"/api/projects/{create_project_via_api}")
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/projects/{project_id}",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/api/projects/{project_id}"}' in body
+    assert 'http_request_db_queries_count{method="GET",route="/api/projects/{project_id}"}' in body
+    # The path parameter is never used as a label
+    assert f'route="/api/projects/{create_project_via_api}"' not in body
+
+def test_query_stats_repeated_statements():
+    """Test that repeated statement shapes are reported and the budget is enforced"""
+    from app.services.metrics import QueryStats, QueryBudgetExceeded
+    
+    stats = QueryStats(record_statements=True, budget=4)
+    for _ in range(3):
+        stats.record("SELECT * FROM inspection_photos\n WHERE inspection_id = ?", 0.001)
+    stats.record("SELECT * FROM projects WHERE id IN (?, ?, ?)", 0.001)
+    assert stats.repeated(threshold=3) == [("SELECT * FROM inspection_photos WHERE inspection_id = ?", 3)]
+    assert "3x SELECT * FROM inspection_photos" in stats.report()
+    
+    with pytest.raises(QueryBudgetExceeded):
+        stats.record("SELECT 1", 0.001)
+
 # Project API tests
 def test_create_project(client, test_project_data):
     """Test creating a project via API"""
@@ -30,7 +61,7 @@ def test_read_projects(client, test_project_data):
     # Get all projects
     response = client.get("/api/projects/")
     assert response.status_code == 200
-    data = response.json()
+    data = response.json()["items"]
     assert len(data) >= 1
     assert any(project["name"] == test_project_data["name"] for project in data)
 
@@ -100,17 +131,46 @@ def test_get_projects_by_owner(client, test_project_data):
     # Get projects with test_owner header
     response = client.get("/api/projects/", headers={"owner": test_project_data["owner"]})
     assert response.status_code == 200
-    projects = response.json()
+    projects = response.json()["items"]
     assert len(projects) >= 1
     assert all(project["owner"] == test_project_data["owner"] for project in projects)
     
     # Get projects with different_owner header
     response = client.get("/api/projects/", headers={"owner": "different_owner"})
     assert response.status_code == 200
-    projects = response.json()
+    projects = response.json()["items"]
     assert len(projects) >= 1
     assert all(project["owner"] == "different_owner" for project in projects)
 
+def test_read_project_tree(client, create_project_via_api, test_inspection_data, mock_photo_bytes, assert_max_queries):
+    """Test getting a project with its inspections and photos in a fixed number of queries"""
+    project_id = create_project_via_api
+    for i in range(3):
+        inspection_data = dict(test_inspection_data, project_id=project_id)
+        inspection_id = client.post("/api/inspections/", json=inspection_data).json()["id"]
+        for j in range(2):
+            photo_data = {"inspection_id": str(inspection_id), "capture_date": str(date.today()), "caption": f"Photo {j}"}
+            files = {"file": (f"tree_{i}_{j}.jpg", io.BytesIO(b"tree photo"), "image/jpeg")}
+            client.post("/api/photos/", data=photo_data, files=files)
+    
+    # Project, then its inspections
+    with assert_max_queries(2):
+        response = client.get(f"/api/projects/{project_id}")
+    assert len(response.json()["inspections"]) == 3
+    
+    # Project, inspections and photos, independent of the number of rows
+    with assert_max_queries(3) as stats:
+        response = client.get(f"/api/projects/{project_id}/tree")
+    assert stats.repeated(threshold=2) == []
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["inspections"]) == 3
+    assert all(len(inspection["photos"]) == 2 for inspection in data["inspections"])
+    
+    response = client.get(f"/api/projects/{project_id}/tree", headers={"owner": "wrong_owner"})
+    assert response.status_code == 403
+
 def test_get_project_storage_info(client, create_project_via_api, test_project_data):
     """Test getting project storage info"""
     project_id = create_project_via_api
@@ -135,6 +195,35 @@ def test_get_project_storage_info(client, create_project_via_api, test_project_d
     data = response.json()
     assert data["project_id"] == project_id
 
+def test_project_storage_accounting(client, create_inspection_via_api):
+    """Test that the project storage total follows uploads and deletions"""
+    inspection_id = create_inspection_via_api
+    project_id = client.get(f"/api/inspections/{inspection_id}").json()["project_id"]
+    
+    pdf_content = b"%PDF-1.5 storage test"
+    files = {"file": ("storage.pdf", io.BytesIO(pdf_content), "application/pdf")}
+    assert client.post(f"/api/inspections/{inspection_id}/upload-pdf", files=files).status_code == 200
+    
+    photo_content = b"storage photo content"
+    photo_data = {"inspection_id": str(inspection_id), "capture_date": str(date.today()), "caption": "Storage"}
+    files = {"file": ("storage.jpg", io.BytesIO(photo_content), "image/jpeg")}
+    photo_id = client.post("/api/photos/", data=photo_data, files=files).json()["id"]
+    
+    data = client.get(f"/api/projects/{project_id}/storage").json()
+    assert data["total_size_bytes"] == len(pdf_content) + len(photo_content)
+    assert data["pdf_count"] == 1
+    assert data["photo_count"] == 1
+    assert data["file_count"] == 2
+    
+    client.delete(f"/api/photos/{photo_id}")
+    data = client.get(f"/api/projects/{project_id}/storage").json()
+    assert data["total_size_bytes"] == len(pdf_content)
+    
+    client.delete(f"/api/inspections/{inspection_id}")
+    data = client.get(f"/api/projects/{project_id}/storage").json()
+    assert data["total_size_bytes"] == 0
+    assert data["file_count"] == 0
+
 def test_delete_project(client, create_project_via_api, test_project_data):
     """Test deleting a project via API"""
     project_id = create_project_via_api
@@ -150,6 +239,31 @@ def test_delete_project(client, create_project_via_api, test_project_data):
     response = client.get(f"/api/projects/{project_id}")
     assert response.status_code == 404
 
+def test_delete_project_query_count(client, test_project_data, test_inspection_data, query_counter):
+    """Test that deleting a project takes the same number of queries however many inspections it has"""
+    counts = []
+    for inspection_count in [1, 4]:
+        project_id = client.post("/api/projects/", json=test_project_data).json()["id"]
+        photo_paths = []
+        for i in range(inspection_count):
+            inspection_id = client.post("/api/inspections/", json=dict(test_inspection_data, project_id=project_id)).json()["id"]
+            image_bytes = io.BytesIO(f"delete {inspection_count} {i}".encode())
+            photo_data = {"inspection_id": str(inspection_id), "capture_date": str(date.today()), "caption": "Delete"}
+            response = client.post("/api/photos/", data=photo_data, files={"file": ("delete.jpg", image_bytes, "image/jpeg")})
+            photo_paths.append(response.json()["photo_path"])
+        
+        with query_counter() as stats:
+            response = client.delete(f"/api/projects/{project_id}", headers={"owner": test_project_data["owner"]})
+        assert response.status_code == 200
+        counts.append(stats.count)
+        
+        # The files are deleted by the background task once the response is sent
+        assert not any(os.path.exists(path) for path in photo_paths)
+        response = client.get("/api/inspections/", params={"project_id": project_id})
+        assert response.json()["items"] == []
+    
+    assert counts[0] == counts[1]
+
 # Inspection API tests
 def test_create_inspection(client, create_project_via_api, test_inspection_data):
     """Test creating an inspection via API"""
@@ -171,17 +285,160 @@ def test_read_inspections(client, create_inspection_via_api):
     # Get all inspections
     response = client.get("/api/inspections/")
     assert response.status_code == 200
-    data = response.json()
+    data = response.json()["items"]
     assert len(data) >= 1
     
     # Get inspections filtered by project_id
     project_id = client.get(f"/api/inspections/{create_inspection_via_api}").json()["project_id"]
     response = client.get(f"/api/inspections/?project_id={project_id}")
     assert response.status_code == 200
-    data = response.json()
+    data = response.json()["items"]
     assert len(data) >= 1
     assert all(inspection["project_id"] == project_id for inspection in data)
 
+def test_inspections_cursor_pagination(client, create_project_via_api, test_inspection_data):
+    """Test walking the inspections of a project page by page with next_cursor"""
+    project_id = create_project_via_api
+    created_ids = []
+    for days in [3, 1, 2, 1, 0]:
+        inspection_data = dict(test_inspection_data, project_id=project_id,
+                               inspection_date=str(date.today() + timedelta(days=days)))
+        created_ids.append(client.post("/api/inspections/", json=inspection_data).json()["id"])
+    
+    seen = []
+    cursor = None
+    while True:
+        params = {"project_id": project_id, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/inspections/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    
+    # Every inspection exactly once, ordered by (inspection_date, id)
+    assert sorted(i["id"] for i in seen) == sorted(created_ids)
+    keys = [(i["inspection_date"], i["id"]) for i in seen]
+    assert keys == sorted(keys)
+
+def test_invalid_cursor(client):
+    """Test that a malformed cursor is rejected"""
+    response = client.get("/api/projects/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+def test_read_inspections_batch(client, create_project_via_api, test_inspection_data):
+    """Test getting several inspections with their photos in one request"""
+    inspection_ids = []
+    for i in range(3):
+        inspection_data = dict(test_inspection_data, project_id=create_project_via_api)
+        inspection_id = client.post("/api/inspections/", json=inspection_data).json()["id"]
+        photo_data = {"inspection_id": str(inspection_id), "capture_date": str(date.today()), "caption": f"Batch {i}"}
+        files = {"file": (f"batch_{i}.jpg", io.BytesIO(b"batch photo"), "image/jpeg")}
+        client.post("/api/photos/", data=photo_data, files=files)
+        inspection_ids.append(inspection_id)
+    
+    requested = [inspection_ids[2], inspection_ids[0]]
+    response = client.post("/api/inspections/batch", json={"ids": requested})
+    assert response.status_code == 200
+    data = response.json()
+    assert [inspection["id"] for inspection in data] == requested
+    assert [inspection["photos"][0]["caption"] for inspection in data] == ["Batch 2", "Batch 0"]
+    
+    response = client.post("/api/inspections/batch", json={"ids": [inspection_ids[0], 999999]})
+    assert response.status_code == 404
+    
+    response = client.post("/api/inspections/batch", json={"ids": []})
+    assert response.status_code == 422
+
+def test_create_merged_report(client, create_project_via_api, test_inspection_data):
+    """Test building a merged report of uploaded forms and photo pages"""
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import patch
+    from reportlab.pdfgen import canvas
+    from PyPDF2 import PdfReader
+    
+    inspection_ids = []
+    for photo_count in [4, 1]:
+        inspection_data = dict(test_inspection_data, project_id=create_project_via_api)
+        inspection_id = client.post("/api/inspections/", json=inspection_data).json()["id"]
+        inspection_ids.append(inspection_id)
+        for i in range(photo_count):
+            image_bytes = io.BytesIO()
+            Image.new("RGB", (64, 48), "green").save(image_bytes, format="JPEG")
+            image_bytes.seek(0)
+            photo_data = {"inspection_id": str(inspection_id), "capture_date": str(date.today()), "caption": f"照片 {i}"}
+            client.post("/api/photos/", data=photo_data, files={"file": (f"report_{i}.jpg", image_bytes, "image/jpeg")})
+    
+    # One-page uploaded form for the first inspection
+    form_bytes = io.BytesIO()
+    form = canvas.Canvas(form_bytes)
+    form.drawString(100, 750, "form")
+    form.save()
+    form_bytes.seek(0)
+    client.post(f"/api/inspections/{inspection_ids[0]}/upload-pdf", files={"file": ("form.pdf", form_bytes, "application/pdf")})
+    
+    from app.utils.report_utils import build_merged_report
+    report_paths = []
+    def build_and_record(inspections):
+        report_paths.append(build_merged_report(inspections))
+        return report_paths[-1]
+    
+    with patch('app.services.jobs.get_executor', return_value=ThreadPoolExecutor(max_workers=1)), \
+         patch('app.api.reports.build_merged_report', build_and_record):
+        response = client.post("/api/reports/merged", json={"ids": inspection_ids})
+    
+    assert response.status_code == 200
+    # The report file is deleted by the response's background task
+    assert not os.path.exists(report_paths[0])
+    assert response.headers["content-type"] == "application/pdf"
+    assert "attachment" in response.headers["content-disposition"]
+    # form (1) + 4 photos (2 pages) + 1 photo (1 page)
+    assert len(PdfReader(io.BytesIO(response.content)).pages) == 4
+
+def test_read_inspection_pdf_page(client, create_inspection_via_api):
+    """Test rendering one page of an uploaded PDF to a cached PNG"""
+    from concurrent.futures import ThreadPoolExecutor
+    from unittest.mock import patch
+    from reportlab.pdfgen import canvas
+    
+    inspection_id = create_inspection_via_api
+    
+    response = client.get(f"/api/inspections/{inspection_id}/pdf/pages/1.png")
+    assert response.status_code == 404
+    
+    form_bytes = io.BytesIO()
+    form = canvas.Canvas(form_bytes)
+    for page in range(2):
+        form.drawString(100, 750, f"page {page + 1}")
+        form.showPage()
+    form.save()
+    form_bytes.seek(0)
+    client.post(f"/api/inspections/{inspection_id}/upload-pdf", files={"file": ("pages.pdf", form_bytes, "application/pdf")})
+    
+    response = client.get(f"/api/inspections/{inspection_id}/pdf/pages")
+    assert response.json() == {"page_count": 2}
+    
+    with patch('app.services.jobs.get_executor', return_value=ThreadPoolExecutor(max_workers=1)) as get_executor:
+        response = client.get(f"/api/inspections/{inspection_id}/pdf/pages/2.png?width=300")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert "max-age" in response.headers["cache-control"]
+        # The width is rounded up to the next supported size
+        assert Image.open(io.BytesIO(response.content)).width == 384
+        
+        # The second request is served from the disk cache without rendering
+        response = client.get(f"/api/inspections/{inspection_id}/pdf/pages/2.png?width=300")
+        assert response.status_code == 200
+        assert get_executor.call_count == 1
+    
+    response = client.get(f"/api/inspections/{inspection_id}/pdf/pages/3.png")
+    assert response.status_code == 404
+
 def test_update_inspection(client, create_inspection_via_api, test_update_inspection_data):
     """Test updating an inspection via API"""
     inspection_id = create_inspection_via_api
@@ -281,7 +538,7 @@ def test_delete_spot_check(client, create_spot_check_via_api, mock_photo_bytes):
     # Verify photos were added
     response = client.get(f"/api/photos/?inspection_id={spot_check_id}")
     assert response.status_code == 200
-    photos_data = response.json()
+    photos_data = response.json()["items"]
     assert len(photos_data) == 2
     
     # Delete the spot check
@@ -298,7 +555,7 @@ def test_delete_spot_check(client, create_spot_check_via_api, mock_photo_bytes):
     # Verify the photos were also deleted (cascade delete)
     response = client.get(f"/api/photos/?inspection_id={spot_check_id}")
     assert response.status_code == 200
-    assert len(response.json()) == 0
+    assert len(response.json()["items"]) == 0
 
 # Photo API tests
 def test_read_photos(client, create_inspection_via_api):
@@ -313,6 +570,50 @@ def test_read_photos(client, create_inspection_via_api):
     response = client.get(f"/api/photos/?inspection_id={inspection_id}")
     assert response.status_code == 200
 
+def test_filter_by_form_and_sequence(client, create_project_via_api, test_inspection_data):
+    """Test filtering photos and inspections by project, form name and per-form sequence number"""
+    inspections = [
+        ("Form A", date(2025, 3, 1), "First A"),
+        ("Form A", date(2025, 3, 2), "Second A"),
+        ("Form B", date(2025, 3, 1), "First B"),
+    ]
+    for form_name, inspection_date, location in inspections:
+        inspection_data = dict(
+            test_inspection_data,
+            project_id=create_project_via_api,
+            inspection_form_name=form_name,
+            inspection_date=str(inspection_date),
+            location=location
+        )
+        inspection_id = client.post("/api/inspections/", json=inspection_data).json()["id"]
+        photo_data = {"inspection_id": str(inspection_id), "capture_date": str(date.today()), "caption": location}
+        files = {"file": ("filter.jpg", io.BytesIO(location.encode()), "image/jpeg")}
+        client.post("/api/photos/", data=photo_data, files=files)
+    
+    response = client.get(f"/api/photos/?project_id={create_project_via_api}")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 3
+    
+    response = client.get(
+        f"/api/photos/?project_id={create_project_via_api}&inspection_form_name=Form A&inspection_sequence=2"
+    )
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert len(items) == 1
+    assert items[0]["caption"] == "Second A"
+    assert items[0]["location"] == "Second A"
+    assert items[0]["inspection_form_name"] == "Form A"
+    assert items[0]["inspection_sequence"] == 2
+    assert items[0]["project_id"] == create_project_via_api
+    assert items[0]["thumbnail_url"] == f"api/photos/{items[0]['id']}/thumbnail"
+    
+    response = client.get(f"/api/inspections/?project_id={create_project_via_api}&sort=sequence")
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [(item["location"], item["inspection_sequence"]) for item in items] == [
+        ("First A", 1), ("Second A", 2), ("First B", 1)
+    ]
+
 def test_read_photo(client, create_photo_via_api, create_inspection_via_api):
     """Test reading a specific photo via API"""
     photo_id = create_photo_via_api
@@ -327,6 +628,34 @@ def test_read_photo(client, create_photo_via_api, create_inspection_via_api):
     assert "photo_path" in data
     assert "caption" in data
 
+def test_read_photo_thumbnail(client, create_inspection_via_api):
+    """Test that uploading a photo creates a thumbnail served by the API"""
+    image_bytes = io.BytesIO()
+    Image.new("RGB", (1600, 1200), "blue").save(image_bytes, format="JPEG")
+    image_bytes.seek(0)
+    
+    photo_data = {
+        "inspection_id": str(create_inspection_via_api),
+        "capture_date": str(date.today()),
+        "caption": "Thumbnail Photo"
+    }
+    files = {"file": ("large.jpg", image_bytes, "image/jpeg")}
+    response = client.post("/api/photos/", data=photo_data, files=files)
+    assert response.status_code == 201
+    photo = response.json()
+    assert photo["thumbnail_url"] == f"api/photos/{photo['id']}/thumbnail"
+    assert photo["preview_url"] == f"api/photos/{photo['id']}/preview"
+    
+    response = client.get(f"/{photo['thumbnail_url']}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).size == (256, 192)
+    
+    response = client.get(f"/api/photos/{photo['id']}/original")
+    assert response.status_code == 404
+    
+    client.delete(f"/api/photos/{photo['id']}")
+
 def test_delete_photo(client, create_photo_via_api):
     """Test deleting a photo via API"""
     photo_id = create_photo_via_api
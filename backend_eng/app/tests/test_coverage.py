@@ -5,6 +5,9 @@ from fastapi.testclient import TestClient
 from fastapi import HTTPException
 from datetime import date, timedelta
 from unittest.mock import patch, MagicMock
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
 from app.main import app
 from app.db.database import get_db
 from app.utils.file_utils import generate_inspection_pdf
@@ -91,18 +94,96 @@ def test_generate_inspection_pdf(client, db: Session):
     create_response = client.post("/api/inspections/", json=inspection_data)
     inspection_id = create_response.json()["id"]
     
-    # 模擬 PDF 生成
-    with patch('app.api.inspections.generate_inspection_pdf') as mock_generate_pdf:
+    # 模擬 PDF 生成，以執行緒池取代行程池以便使用 mock
+    executor = ThreadPoolExecutor(max_workers=1)
+    with patch('app.services.jobs.generate_inspection_pdf') as mock_generate_pdf, \
+         patch('app.services.jobs.get_executor', return_value=executor), \
+         patch('app.services.jobs.SessionLocal', lambda: nullcontext(db)):
         mock_generate_pdf.return_value = "app/static/uploads/pdfs/generated_test.pdf"
         
         # 生成 PDF
         response = client.post(f"/api/inspections/{inspection_id}/generate-pdf")
         
-        assert response.status_code == 200
-        data = response.json()
-        assert data["id"] == inspection_id
-        assert data["pdf_path"] == "app/static/uploads/pdfs/generated_test.pdf"
+        assert response.status_code == 202
+        job = response.json()
+        assert job["inspection_id"] == inspection_id
+        
+        # 等待背景工作完成
+        executor.shutdown(wait=True)
         mock_generate_pdf.assert_called_once()
+    
+    # 查詢工作狀態
+    response = client.get(f"/api/jobs/{job['id']}")
+    assert response.status_code == 200
+    assert response.json()["status"] == "succeeded"
+    assert response.json()["pdf_path"] == "app/static/uploads/pdfs/generated_test.pdf"
+    
+    response = client.get(f"/api/inspections/{inspection_id}")
+    assert response.json()["pdf_path"] == "app/static/uploads/pdfs/generated_test.pdf"
+
+def test_generate_inspection_pdf_failure(client, db: Session, create_inspection_via_api):
+    """Test that a failed PDF build is reported on the job"""
+    executor = ThreadPoolExecutor(max_workers=1)
+    with patch('app.services.jobs.generate_inspection_pdf', side_effect=RuntimeError("boom")), \
+         patch('app.services.jobs.get_executor', return_value=executor), \
+         patch('app.services.jobs.SessionLocal', lambda: nullcontext(db)):
+        response = client.post(f"/api/inspections/{create_inspection_via_api}/generate-pdf")
+        assert response.status_code == 202
+        executor.shutdown(wait=True)
+    
+    response = client.get(f"/api/jobs/{response.json()['id']}")
+    assert response.json()["status"] == "failed"
+    assert response.json()["error"] == "boom"
+
+def test_generate_inspection_pdf_broken_pool(client, create_inspection_via_api):
+    """Test that a job is marked failed and the pool replaced when the render pool is broken"""
+    broken = MagicMock()
+    broken.submit.side_effect = BrokenProcessPool("A child process terminated abruptly")
+    with patch('app.services.jobs._executor', broken), \
+         patch('app.services.jobs.ProcessPoolExecutor', return_value=broken) as new_pool:
+        response = client.post(f"/api/inspections/{create_inspection_via_api}/generate-pdf")
+        assert response.status_code == 202
+        # 損壞的行程池被捨棄，並以新的行程池重試一次
+        broken.shutdown.assert_called_with(wait=False)
+        new_pool.assert_called_once()
+    
+    response = client.get(f"/api/jobs/{response.json()['id']}")
+    assert response.json()["status"] == "failed"
+    assert response.json()["error"] == "A child process terminated abruptly"
+
+def test_finish_pdf_render_deleted_inspection(client, db: Session, create_inspection_via_api):
+    """Test that a job whose inspection was deleted during the build is failed and its PDF removed"""
+    from concurrent.futures import Future
+    from app.services import crud, jobs
+    from app.utils.file_utils import PDF_UPLOAD_DIR
+    
+    job_id = crud.create_render_job(db, create_inspection_via_api).id
+    response = client.delete(f"/api/inspections/{create_inspection_via_api}")
+    assert response.status_code == 200
+    
+    # 模擬刪除後才完成的 PDF
+    os.makedirs(PDF_UPLOAD_DIR, exist_ok=True)
+    pdf_path = os.path.join(PDF_UPLOAD_DIR, "orphan_render.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(b"rendered")
+    future = Future()
+    future.set_result(pdf_path)
+    
+    # 回呼結束時會釋放提交時取得的名額
+    jobs._pending_slots.acquire()
+    with patch('app.services.jobs.SessionLocal', lambda: nullcontext(db)):
+        jobs._finish_pdf_render(job_id, create_inspection_via_api, None, future)
+    
+    assert not os.path.exists(pdf_path)
+    response = client.get(f"/api/jobs/{job_id}")
+    assert response.json()["status"] == "failed"
+    assert response.json()["error"] == "Inspection was deleted"
+
+def test_get_nonexistent_job(client):
+    """Test getting a non-existent render job"""
+    response = client.get("/api/jobs/does-not-exist")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Job not found"
 
 # 測試照片 API 的更新功能 (photos.py 行 25-41)
 def test_update_photo(client, db: Session):
@@ -176,7 +257,7 @@ def test_generate_inspection_pdf_function():
          patch('app.utils.file_utils.os.path.join') as mock_join, \
          patch('app.utils.file_utils.ensure_upload_dirs') as mock_ensure_dirs, \
          patch('app.utils.file_utils.SimpleDocTemplate') as mock_doc, \
-         patch('app.utils.file_utils.getSampleStyleSheet') as mock_styles, \
+         patch('app.utils.file_utils.get_sample_styles') as mock_styles, \
          patch('app.utils.file_utils.Paragraph') as mock_para, \
          patch('app.utils.file_utils.Spacer') as mock_spacer, \
          patch('app.utils.file_utils.RLImage') as mock_image, \
@@ -8,6 +8,7 @@ from app.services.crud import (
     get_projects_by_owner
 )
 from app.schemas import schemas
+from sqlalchemy import inspect
 from app.models.models import Project, ConstructionInspection, InspectionPhoto
 
 # Project CRUD tests
@@ -119,6 +120,21 @@ def test_delete_project(db, test_project):
         get_project(db, test_project.id)
     assert excinfo.value.status_code == 404
 
+def test_delete_project_detaches_loaded_objects(db, test_project, test_inspection, test_photo):
+    """Test that objects of the deleted rows loaded in the session stay readable after the bulk delete"""
+    project_name = test_project.name
+    
+    delete_project(db, test_project.id)
+    
+    for obj in (test_project, test_inspection, test_photo):
+        assert inspect(obj).detached
+    assert test_project.name == project_name
+    assert test_inspection.project_id == test_project.id
+    assert test_photo.inspection_id == test_inspection.id
+    assert db.get(Project, test_project.id) is None
+    assert db.get(ConstructionInspection, test_inspection.id) is None
+    assert db.get(InspectionPhoto, test_photo.id) is None
+
 # Inspection CRUD tests
 def test_create_inspection(db, test_project_id, test_inspection_data):
     """Test creating an inspection"""
@@ -230,3 +246,42 @@ def test_delete_photo(db, test_photo):
     with pytest.raises(HTTPException) as excinfo:
         get_photo(db, test_photo.id)
     assert excinfo.value.status_code == 404
+
+# Async CRUD tests, on a real aiosqlite database
+async def test_async_create_inspection_and_photo(async_db, mock_pdf_path, mock_photo_path):
+    """Test the async inspection and photo operations of the async handlers"""
+    from app.services import async_crud
+    from app.utils.file_utils import get_file_size
+    
+    project = Project(
+        name="Async Project", location="Site", contractor="Contractor",
+        start_date=date.today(), end_date=date.today(), owner="async_owner"
+    )
+    async_db.add(project)
+    await async_db.commit()
+    
+    inspection_data = schemas.InspectionCreate(
+        project_id=project.id, subproject_name="Sub", inspection_form_name="Form",
+        inspection_date=date.today(), location="Here", timing="隨機抽查", result="合格"
+    )
+    first = await async_crud.create_inspection(async_db, inspection_data)
+    second = await async_crud.create_inspection(async_db, inspection_data)
+    assert (first.inspection_sequence, second.inspection_sequence) == (1, 2)
+    
+    photo = await async_crud.create_photo(async_db, schemas.PhotoCreate(
+        inspection_id=first.id, photo_path=mock_photo_path, capture_date=date.today()
+    ))
+    assert photo.file_size == get_file_size(mock_photo_path) > 0
+    
+    updated = await async_crud.update_inspection(
+        async_db, first.id, schemas.InspectionUpdate(result="不合格", pdf_path=mock_pdf_path)
+    )
+    assert updated.result == "不合格"
+    assert updated.pdf_size == get_file_size(mock_pdf_path) > 0
+    
+    await async_db.refresh(project)
+    assert project.storage_bytes == photo.file_size + updated.pdf_size
+    
+    with pytest.raises(HTTPException) as exc_info:
+        await async_crud.get_inspection(async_db, 999)
+    assert exc_info.value.status_code == 404
@@ -19,3 +19,133 @@ def test_create_tables(db):
     assert "projects" in tables
     assert "construction_inspections" in tables
     assert "inspection_photos" in tables
+
+def test_secondary_indexes(db):
+    """Test that the list queries are backed by secondary indexes"""
+    result = db.execute(text(
+        "SELECT name FROM sqlite_master WHERE type='index'"
+    ))
+    indexes = [row[0] for row in result]
+    assert "ix_projects_owner_id" in indexes
+    assert "ix_construction_inspections_project_id_inspection_date" in indexes
+    assert "ix_inspection_photos_inspection_id" in indexes
+
+def test_migrations_match_models(tmp_path):
+    """Test that upgrading an empty database to head yields the model schema"""
+    from alembic import command
+    from alembic.config import Config
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from sqlalchemy import create_engine
+    
+    url = f"sqlite:///{tmp_path / 'migrations.db'}"
+    config = Config("alembic.ini")
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "head")
+    
+    migrated_engine = create_engine(url)
+    with migrated_engine.connect() as connection:
+        diff = compare_metadata(MigrationContext.configure(connection), Base.metadata)
+    migrated_engine.dispose()
+    assert diff == []
+
+def head_revision(url):
+    """Return the newest migration revision"""
+    from alembic.script import ScriptDirectory
+    from migrate_db import alembic_config
+    return ScriptDirectory.from_config(alembic_config(url)).get_current_head()
+
+def test_upgrade_database_legacy_schema(tmp_path):
+    """Test upgrading an unstamped baseline database that create_tables() gave a render_jobs table"""
+    from alembic import command
+    from sqlalchemy import create_engine, inspect
+    from migrate_db import alembic_config, upgrade_database
+    
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    # 建立基準版本的資料表後移除版本紀錄，模擬 create_tables() 建立的舊資料庫
+    command.upgrade(alembic_config(url), "0001")
+    legacy_engine = create_engine(url)
+    with legacy_engine.begin() as connection:
+        connection.execute(text("DROP TABLE alembic_version"))
+        connection.execute(text("CREATE TABLE render_jobs (id VARCHAR(36) PRIMARY KEY)"))
+    
+    upgrade_database(url)
+    
+    inspector = inspect(legacy_engine)
+    assert "storage_bytes" in {column["name"] for column in inspector.get_columns("projects")}
+    assert "inspection_id" in {column["name"] for column in inspector.get_columns("render_jobs")}
+    with legacy_engine.connect() as connection:
+        assert connection.execute(text("SELECT version_num FROM alembic_version")).scalar() == head_revision(url)
+    legacy_engine.dispose()
+
+def test_upgrade_database_stamps_create_all_schema(tmp_path):
+    """Test that an unstamped database created from the current models is stamped head"""
+    from sqlalchemy import create_engine
+    from migrate_db import upgrade_database
+    
+    url = f"sqlite:///{tmp_path / 'create_all.db'}"
+    current_engine = create_engine(url)
+    Base.metadata.create_all(bind=current_engine)
+    
+    upgrade_database(url)
+    
+    with current_engine.connect() as connection:
+        assert connection.execute(text("SELECT version_num FROM alembic_version")).scalar() == head_revision(url)
+    current_engine.dispose()
+
+def test_pool_metrics():
+    """Test that the pool events and session waits are exported as Prometheus metrics"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import QueuePool
+    from prometheus_client import REGISTRY
+    from app.services.metrics import instrument_pool, instrument_sessions
+    
+    def sample(name):
+        return REGISTRY.get_sample_value(name) or 0.0
+    
+    before = {
+        name: sample(name) for name in (
+            "db_pool_size", "db_pool_checked_out_connections", "db_pool_overflow_connections",
+            "db_pool_connects_total", "db_pool_checkouts_total",
+            "db_connection_hold_seconds_count", "db_pool_checkout_wait_seconds_count"
+        )
+    }
+    pooled_engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=1, max_overflow=1)
+    instrument_pool(pooled_engine)
+    session_factory = sessionmaker(bind=pooled_engine)
+    instrument_sessions(session_factory)
+    
+    # 兩個連線同時借出，第二個超出 pool_size
+    with pooled_engine.connect(), pooled_engine.connect():
+        assert sample("db_pool_checked_out_connections") - before["db_pool_checked_out_connections"] == 2
+        assert sample("db_pool_overflow_connections") - before["db_pool_overflow_connections"] == 1
+    assert sample("db_pool_checked_out_connections") == before["db_pool_checked_out_connections"]
+    assert sample("db_pool_overflow_connections") == before["db_pool_overflow_connections"]
+    
+    with session_factory() as session:
+        session.execute(text("SELECT 1"))
+    pooled_engine.dispose()
+    
+    assert sample("db_pool_size") - before["db_pool_size"] == 1
+    assert sample("db_pool_connects_total") - before["db_pool_connects_total"] == 2
+    assert sample("db_pool_checkouts_total") - before["db_pool_checkouts_total"] == 3
+    assert sample("db_connection_hold_seconds_count") - before["db_connection_hold_seconds_count"] == 3
+    assert sample("db_pool_checkout_wait_seconds_count") - before["db_pool_checkout_wait_seconds_count"] == 1
+
+def test_pool_metrics_endpoint(client):
+    """Test that the pool metrics are served on /metrics"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "db_pool_checkouts_total" in response.text
+    assert "db_pool_checkout_wait_seconds_bucket" in response.text
+
+def test_async_database_url():
+    """Test that the async engine uses the async driver of the same database"""
+    from app.db.database import async_database_url
+    
+    assert async_database_url("sqlite:///./data/app.db") == "sqlite+aiosqlite:///./data/app.db"
+    assert async_database_url("mysql+mysqlconnector://root:password@db:3306/mydatabase") == \
+        "mysql+aiomysql://root:password@db:3306/mydatabase"
+    with pytest.raises(ValueError):
+        async_database_url("postgresql://db/mydatabase")
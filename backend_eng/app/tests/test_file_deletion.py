@@ -222,6 +222,28 @@ def test_update_photo_replace_file(client, db, test_photo, mock_photo_path, test
     if os.path.exists(new_photo_path):
         os.remove(new_photo_path)
 
+def test_shared_photo_file_deleted_with_last_reference(client, db, test_inspection, mock_photo_path):
+    """測試多筆照片共用同一檔案時，只有刪除最後一筆才刪除實體檔案"""
+    photos = []
+    for caption in ("First", "Second"):
+        photo = InspectionPhoto(
+            inspection_id=test_inspection.id,
+            photo_path=mock_photo_path,
+            capture_date=date.today(),
+            caption=caption
+        )
+        db.add(photo)
+        photos.append(photo)
+    db.commit()
+    
+    response = client.delete(f"/api/photos/{photos[0].id}")
+    assert response.status_code == 200
+    assert os.path.exists(mock_photo_path), "仍被其他照片使用的檔案不應刪除"
+    
+    response = client.delete(f"/api/photos/{photos[1].id}")
+    assert response.status_code == 200
+    assert not os.path.exists(mock_photo_path), "最後一筆照片刪除後檔案應該被刪除"
+
 @patch('os.path.exists')
 @patch('app.services.crud.os.remove')
 def test_error_handling_when_file_not_exists(mock_remove, mock_exists, client, db, test_inspection):
@@ -254,3 +276,21 @@ def test_error_handling_when_file_not_exists(mock_remove, mock_exists, client, d
     mock_exists.assert_called_with("/non/existent/path/photo.jpg")
     # 確認 os.remove 被調用
     mock_remove.assert_called_once_with("/non/existent/path/photo.jpg")
+
+def test_release_keeps_pinned_upload(client, db, test_photo_with_file, mock_photo_path):
+    """測試上傳中（資料列尚未提交）重用的檔案不會被同時進行的刪除移除"""
+    from app.utils.file_utils import new_pin, unpin_stored_file, _pin_path
+    from app.services.crud import release_files
+    
+    pin = new_pin()
+    open(_pin_path(mock_photo_path, pin), "w").close()
+    
+    # 刪除最後一筆參照此檔案的照片，檔案因仍被上傳釘住而保留
+    response = client.delete(f"/api/photos/{test_photo_with_file.id}")
+    assert response.status_code == 200
+    assert os.path.exists(mock_photo_path), "被釘住的檔案不應該被刪除"
+    
+    # 釋放後再次檢查參照，檔案才會被刪除
+    unpin_stored_file(mock_photo_path, pin)
+    release_files(db, [mock_photo_path])
+    assert not os.path.exists(mock_photo_path), "釋放後的檔案應該被刪除"
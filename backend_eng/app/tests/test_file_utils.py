@@ -1,13 +1,23 @@
 import pytest
 import os
 import shutil
-from fastapi import UploadFile
+import io
+import hashlib
+from fastapi import UploadFile, HTTPException
 from unittest.mock import MagicMock, patch
+from PIL import Image
 from app.utils.file_utils import (
     ensure_upload_dirs,
     save_upload_file,
     save_pdf_file,
     save_photo_file,
+    UPLOAD_CHUNK_SIZE,
+    create_photo_derivatives,
+    get_photo_derivative,
+    delete_photo_derivatives,
+    photo_derivative_path,
+    reconcile_project_storage,
+    calculate_project_files_size,
     generate_inspection_pdf,
     PDF_UPLOAD_DIR,
     PHOTO_UPLOAD_DIR
@@ -43,13 +53,8 @@ def test_ensure_upload_dirs(cleanup_upload_dirs):
 @pytest.mark.asyncio
 async def test_save_upload_file(cleanup_upload_dirs):
     """Test saving an uploaded file"""
-    # Create a mock UploadFile
-    mock_file = MagicMock(spec=UploadFile)
-    mock_file.filename = "test.txt"
-    # Use a coroutine for read method
-    async def mock_read():
-        return b"test content"
-    mock_file.read = mock_read
+    # Create an UploadFile backed by an in-memory buffer
+    mock_file = UploadFile(file=io.BytesIO(b"test content"), filename="test.txt")
     
     # Call the function
     file_path = await save_upload_file(mock_file, PDF_UPLOAD_DIR)
@@ -64,13 +69,8 @@ async def test_save_upload_file(cleanup_upload_dirs):
 @pytest.mark.asyncio
 async def test_save_pdf_file(cleanup_upload_dirs):
     """Test saving a PDF file"""
-    # Create a mock UploadFile
-    mock_file = MagicMock(spec=UploadFile)
-    mock_file.filename = "test.pdf"
-    # Use a coroutine for read method
-    async def mock_read():
-        return b"%PDF-1.5\ntest pdf content"
-    mock_file.read = mock_read
+    # Create an UploadFile backed by an in-memory buffer
+    mock_file = UploadFile(file=io.BytesIO(b"%PDF-1.5\ntest pdf content"), filename="test.pdf")
     
     # Call the function
     file_path = await save_pdf_file(mock_file)
@@ -86,13 +86,8 @@ async def test_save_pdf_file(cleanup_upload_dirs):
 @pytest.mark.asyncio
 async def test_save_photo_file(cleanup_upload_dirs):
     """Test saving a photo file"""
-    # Create a mock UploadFile
-    mock_file = MagicMock(spec=UploadFile)
-    mock_file.filename = "test.jpg"
-    # Use a coroutine for read method
-    async def mock_read():
-        return b"test image content"
-    mock_file.read = mock_read
+    # Create an UploadFile backed by an in-memory buffer
+    mock_file = UploadFile(file=io.BytesIO(b"test image content"), filename="test.jpg")
     
     # Call the function
     file_path = await save_photo_file(mock_file)
@@ -105,6 +100,98 @@ async def test_save_photo_file(cleanup_upload_dirs):
         assert content == b"test image content"
 
 
+@pytest.mark.asyncio
+async def test_save_upload_file_multiple_chunks(cleanup_upload_dirs):
+    """Test that uploads larger than one chunk are written completely"""
+    content = os.urandom(UPLOAD_CHUNK_SIZE * 2 + 123)
+    mock_file = UploadFile(file=io.BytesIO(content), filename="large.bin")
+    
+    file_path = await save_upload_file(mock_file, PHOTO_UPLOAD_DIR)
+    
+    with open(file_path, "rb") as f:
+        assert f.read() == content
+    assert not [name for name in os.listdir(PHOTO_UPLOAD_DIR) if name.endswith(".part")]
+
+
+@pytest.mark.asyncio
+async def test_save_upload_file_deduplicates_content(cleanup_upload_dirs):
+    """Test that the same content uploaded twice is stored once under its hash"""
+    first = await save_upload_file(UploadFile(file=io.BytesIO(b"same shot"), filename="a.JPG"), PHOTO_UPLOAD_DIR)
+    second = await save_upload_file(UploadFile(file=io.BytesIO(b"same shot"), filename="b.jpg"), PHOTO_UPLOAD_DIR)
+    other = await save_upload_file(UploadFile(file=io.BytesIO(b"other shot"), filename="c.jpg"), PHOTO_UPLOAD_DIR)
+    
+    assert first == second
+    assert os.path.basename(first) == f"{hashlib.sha256(b'same shot').hexdigest()}.jpg"
+    assert other != first
+    assert sorted(os.listdir(PHOTO_UPLOAD_DIR)) == sorted([os.path.basename(first), os.path.basename(other)])
+
+
+@pytest.mark.asyncio
+async def test_save_upload_file_too_large(cleanup_upload_dirs):
+    """Test that an upload over the size limit is rejected and nothing is left behind"""
+    mock_file = UploadFile(file=io.BytesIO(b"x" * 100), filename="too_large.jpg")
+    ensure_upload_dirs()
+    existing_files = set(os.listdir(PHOTO_UPLOAD_DIR))
+    
+    with pytest.raises(HTTPException) as excinfo:
+        await save_upload_file(mock_file, PHOTO_UPLOAD_DIR, max_size=10)
+    
+    assert excinfo.value.status_code == 413
+    assert set(os.listdir(PHOTO_UPLOAD_DIR)) == existing_files
+
+
+def test_create_photo_derivatives(cleanup_upload_dirs):
+    """Test creating, lazily rebuilding and deleting resized copies of a photo"""
+    ensure_upload_dirs()
+    photo_path = os.path.join(PHOTO_UPLOAD_DIR, "derivative_test.png")
+    Image.new("RGB", (2000, 1500), "red").save(photo_path)
+    
+    derivatives = create_photo_derivatives(photo_path)
+    
+    assert set(derivatives) == {"thumbnail", "preview"}
+    with Image.open(derivatives["thumbnail"]) as img:
+        assert img.format == "JPEG"
+        assert img.size == (256, 192)
+    with Image.open(derivatives["preview"]) as img:
+        assert img.size == (1024, 768)
+    
+    # A missing derivative is rebuilt on demand
+    os.remove(derivatives["thumbnail"])
+    assert get_photo_derivative(photo_path, "thumbnail") == derivatives["thumbnail"]
+    assert os.path.exists(derivatives["thumbnail"])
+    
+    delete_photo_derivatives(photo_path)
+    assert not os.path.exists(photo_derivative_path(photo_path, "thumbnail"))
+    assert not os.path.exists(photo_derivative_path(photo_path, "preview"))
+
+
+def test_create_photo_derivatives_not_an_image(cleanup_upload_dirs):
+    """Test that a file which is not an image produces no derivatives"""
+    ensure_upload_dirs()
+    photo_path = os.path.join(PHOTO_UPLOAD_DIR, "not_an_image.jpg")
+    with open(photo_path, "wb") as f:
+        f.write(b"not an image")
+    
+    assert create_photo_derivatives(photo_path) == {}
+
+
+def test_reconcile_project_storage(db, test_project, test_photo, mock_photo_path):
+    """Test that reconciling fixes sizes recorded out of step with the files"""
+    # test_photo is inserted directly, so nothing has been recorded for it yet
+    assert calculate_project_files_size(db, test_project.id)["total_size_bytes"] == 0
+    
+    results = reconcile_project_storage(db, project_id=test_project.id)
+    
+    expected_size = os.path.getsize(mock_photo_path)
+    assert results == [{
+        "project_id": test_project.id,
+        "previous_size_bytes": 0,
+        "total_size_bytes": expected_size
+    }]
+    assert test_photo.file_size == expected_size
+    assert calculate_project_files_size(db, test_project.id)["total_size_bytes"] == expected_size
+
+
 def test_generate_inspection_pdf(cleanup_upload_dirs):
     """Test generating an inspection PDF"""
     # Create mock inspection data
@@ -133,3 +220,48 @@ def test_generate_inspection_pdf(cleanup_upload_dirs):
     with open(file_path, "rb") as f:
         content = f.read()
         assert content.startswith(b"%PDF")
+
+
+def test_report_styles_are_built_once():
+    """Test that the report font is registered and styles are built once per process"""
+    from app.utils.report_utils import register_report_fonts, get_report_styles, get_sample_styles
+    
+    with patch('app.utils.report_utils.pdfmetrics.registerFont') as mock_register:
+        register_report_fonts.cache_clear()
+        get_report_styles.cache_clear()
+        
+        styles = get_report_styles()
+        assert get_report_styles() is styles
+        register_report_fonts()
+        mock_register.assert_called_once()
+    
+    assert styles["normal"].parent is get_sample_styles()["Normal"]
+    assert get_sample_styles() is get_sample_styles()
+
+
+def test_prepare_report_image(cleanup_upload_dirs):
+    """Test downscaling a photo for a report and reusing the prepared copy"""
+    from app.utils.report_images import prepare_report_image, delete_report_images, REPORT_IMAGE_DPI
+    
+    ensure_upload_dirs()
+    photo_path = os.path.join(PHOTO_UPLOAD_DIR, "report_large.jpg")
+    Image.new("RGB", (4000, 3000), "blue").save(photo_path, "JPEG")
+    
+    # A 144 x 144 point box at the report resolution
+    image_path = prepare_report_image(photo_path, 144, 144)
+    with Image.open(image_path) as img:
+        assert img.size == (2 * REPORT_IMAGE_DPI, 2 * REPORT_IMAGE_DPI * 3 // 4)
+    
+    # The second build reuses the prepared copy
+    with patch('app.utils.report_images.Image.open') as mock_open:
+        assert prepare_report_image(photo_path, 144, 144) == image_path
+        mock_open.assert_not_called()
+    
+    delete_report_images(photo_path)
+    assert not os.path.exists(image_path)
+    
+    # Files that are not images are reported as unreadable
+    text_path = os.path.join(PHOTO_UPLOAD_DIR, "report_text.jpg")
+    with open(text_path, "w") as f:
+        f.write("not an image")
+    assert prepare_report_image(text_path, 144, 144) is None
@@ -1,52 +1,246 @@
 import os
+import glob
 import uuid
-from fastapi import UploadFile
-from typing import List
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
 from datetime import datetime
-from PIL import Image
+from PIL import Image, ImageOps
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet
 from sqlalchemy.orm import Session
+from app.utils.report_utils import get_sample_styles
+from app.utils.report_images import prepare_report_image
 
 # Base directories for uploads
 PDF_UPLOAD_DIR = "app/static/uploads/pdfs"
 PHOTO_UPLOAD_DIR = "app/static/uploads/photos"
 
+# Lock file serializing the reuse and the deletion of stored files across worker processes
+STORAGE_LOCK_PATH = "app/static/uploads/.storage.lock"
+
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Maximum size of a single upload in bytes, 0 disables the limit
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+
+# Resized copies of each photo, keyed by kind, with the longest edge in pixels
+PHOTO_DERIVATIVE_SIZES = {
+    "thumbnail": 256,
+    "preview": 1024,
+}
+
+def file_hash(file_path: str) -> str:
+    """Return the SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=4096)
+def _cached_file_hash(file_path: str, mtime_ns: int, size: int) -> str:
+    return file_hash(file_path)
+
+def file_content_hash(file_path: str) -> str:
+    """Return the SHA-256 of a file, hashing each version of a file only once per worker"""
+    stat = os.stat(file_path)
+    return _cached_file_hash(file_path, stat.st_mtime_ns, stat.st_size)
+
 def ensure_upload_dirs():
     """Ensure upload directories exist"""
     os.makedirs(PDF_UPLOAD_DIR, exist_ok=True)
     os.makedirs(PHOTO_UPLOAD_DIR, exist_ok=True)
 
-async def save_upload_file(upload_file: UploadFile, directory: str) -> str:
-    """Save an uploaded file to the specified directory and return the file path"""
-    ensure_upload_dirs()
+def stored_file_path(directory: str, digest: str, filename: Optional[str]) -> str:
+    """Return the content-addressed path of a file, named by its SHA-256 digest"""
+    _, ext = os.path.splitext(filename or "")
+    return os.path.join(directory, f"{digest}{ext.lower()}")
+
+@contextmanager
+def storage_lock():
+    """Hold the lock that serializes reusing and deleting stored files, across threads and processes"""
+    os.makedirs(os.path.dirname(STORAGE_LOCK_PATH), exist_ok=True)
+    with open(STORAGE_LOCK_PATH, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _pin_path(file_path: str, pin: str) -> str:
+    return f"{file_path}.{pin}.pin"
+
+def new_pin() -> str:
+    """Return a new pin id, see save_upload_file"""
+    return uuid.uuid4().hex
+
+def is_pinned(file_path: str) -> bool:
+    """Return whether an upload whose row is not committed yet uses a stored file (call with storage_lock held)"""
+    return bool(glob.glob(_pin_path(glob.escape(file_path), "*")))
+
+def unpin_stored_file(file_path: str, pin: str):
+    """Release a pin taken by save_upload_file, once the row referring to the file is committed"""
+    Path(_pin_path(file_path, pin)).unlink(missing_ok=True)
+
+def _store_upload(temp_path: str, file_path: str, pin: Optional[str]):
+    """Move a finished upload to its content-addressed path, reusing an existing copy"""
+    with storage_lock():
+        if pin:
+            Path(_pin_path(file_path, pin)).touch()
+        if os.path.exists(file_path):
+            # Same content is already stored, keep the existing copy
+            os.remove(temp_path)
+        else:
+            # New content, or the last copy was just released by a delete
+            os.replace(temp_path, file_path)
+
+async def save_upload_file(
+    upload_file: UploadFile,
+    directory: str,
+    max_size: int = MAX_UPLOAD_SIZE,
+    pin: Optional[str] = None
+) -> str:
+    """
+    Stream an uploaded file to the specified directory and return the file path.
     
-    # Generate a unique filename
-    filename = f"{uuid.uuid4()}_{upload_file.filename}"
-    file_path = os.path.join(directory, filename)
+    The upload is copied in fixed-size chunks to a temporary file, with the disk
+    writes offloaded to a thread, and hashed on the way. The file is stored under
+    its SHA-256 digest, so uploading the same content again reuses the existing
+    file instead of keeping another copy. Stored files are shared between rows
+    and only deleted with their last reference (see crud.release_files).
     
-    # Write the file
-    with open(file_path, "wb") as buffer:
-        content = await upload_file.read()
-        buffer.write(content)
+    A stored file can be reused while a delete of its last row is running. Pass
+    a pin (see new_pin) to keep the file from being deleted until the row that
+    refers to it is committed, then release it with unpin_stored_file.
+    
+    Args:
+        upload_file: The uploaded file
+        directory: Target directory
+        max_size: Maximum accepted size in bytes (0 disables the limit)
+        pin: Pin id to hold on the stored file
+        
+    Returns:
+        Path of the saved file
+    """
+    ensure_upload_dirs()
+    
+    # Write to a uniquely named temporary file, the final name is only known at the end
+    temp_path = os.path.join(directory, f"{uuid.uuid4()}.part")
+    
+    # Write the file chunk by chunk, aborting as soon as the limit is exceeded
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(temp_path, "wb") as buffer:
+            while True:
+                chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the upload limit of {format_file_size(max_size)}"
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(buffer.write, chunk)
+        
+        file_path = stored_file_path(directory, digest.hexdigest(), upload_file.filename)
+        await run_in_threadpool(_store_upload, temp_path, file_path, pin)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
     
     return file_path
 
-async def save_pdf_file(upload_file: UploadFile) -> str:
+async def save_pdf_file(upload_file: UploadFile, pin: Optional[str] = None) -> str:
     """Save an uploaded PDF file and return the file path"""
-    return await save_upload_file(upload_file, PDF_UPLOAD_DIR)
+    return await save_upload_file(upload_file, PDF_UPLOAD_DIR, pin=pin)
 
-async def save_photo_file(upload_file: UploadFile) -> str:
+async def save_photo_file(upload_file: UploadFile, pin: Optional[str] = None) -> str:
     """Save an uploaded photo file and return the file path"""
-    return await save_upload_file(upload_file, PHOTO_UPLOAD_DIR)
+    return await save_upload_file(upload_file, PHOTO_UPLOAD_DIR, pin=pin)
+
+def photo_derivative_path(photo_path: str, kind: str) -> str:
+    """Return the path of a resized copy of a photo, stored next to the original"""
+    base, _ = os.path.splitext(photo_path)
+    return f"{base}_{kind}.jpg"
+
+def create_photo_derivative(photo_path: str, kind: str) -> Optional[str]:
+    """
+    Create one resized JPEG copy of a photo.
+    
+    Args:
+        photo_path: Path of the original photo
+        kind: One of the keys of PHOTO_DERIVATIVE_SIZES
+        
+    Returns:
+        Path of the derivative, or None if the original could not be read as an image
+    """
+    size = PHOTO_DERIVATIVE_SIZES[kind]
+    output_path = photo_derivative_path(photo_path, kind)
+    try:
+        with Image.open(photo_path) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGB")
+            img.thumbnail((size, size))
+            img.save(output_path, "JPEG", quality=85, optimize=True)
+    except (OSError, ValueError) as e:
+        print(f"Error creating {kind} for photo {photo_path}: {e}")
+        return None
+    return output_path
+
+def create_photo_derivatives(photo_path: str) -> dict:
+    """Create the resized copies of a photo that do not exist yet and return the paths keyed by kind"""
+    derivatives = {}
+    for kind in PHOTO_DERIVATIVE_SIZES:
+        path = get_photo_derivative(photo_path, kind)
+        if path:
+            derivatives[kind] = path
+    return derivatives
+
+def get_photo_derivative(photo_path: str, kind: str) -> Optional[str]:
+    """Return the path of a resized copy of a photo, rebuilding it if it is missing"""
+    path = photo_derivative_path(photo_path, kind)
+    if os.path.exists(path):
+        return path
+    if not os.path.exists(photo_path):
+        return None
+    return create_photo_derivative(photo_path, kind)
+
+def delete_photo_derivatives(photo_path: str):
+    """Delete the resized copies of a photo"""
+    for kind in PHOTO_DERIVATIVE_SIZES:
+        path = photo_derivative_path(photo_path, kind)
+        try:
+            Path(path).unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Error deleting {kind} file {path}: {e}")
+
+def get_file_size(file_path: str) -> int:
+    """Return the size of a file in bytes, or 0 if it does not exist"""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
 
 def calculate_project_files_size(db: Session, project_id: int) -> dict:
     """
     Calculate the total size of static files related to a specific project.
     
+    Sizes are recorded when files are uploaded, so this is a single aggregate
+    query without any filesystem access. Use reconcile_project_storage to
+    correct the recorded sizes if files were changed outside the API.
+    
     Args:
         db: Database session
         project_id: ID of the project
@@ -54,11 +248,23 @@ def calculate_project_files_size(db: Session, project_id: int) -> dict:
     Returns:
         Dictionary with storage information for the project
     """
+    from sqlalchemy import func, distinct, case
     from app.models.models import Project, ConstructionInspection, InspectionPhoto
     
-    # Get the project
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
+    row = (
+        db.query(
+            Project.name,
+            Project.storage_bytes,
+            func.count(distinct(case((ConstructionInspection.pdf_path.isnot(None), ConstructionInspection.id)))),
+            func.count(InspectionPhoto.id),
+        )
+        .outerjoin(ConstructionInspection, ConstructionInspection.project_id == Project.id)
+        .outerjoin(InspectionPhoto, InspectionPhoto.inspection_id == ConstructionInspection.id)
+        .filter(Project.id == project_id)
+        .group_by(Project.id, Project.name, Project.storage_bytes)
+        .first()
+    )
+    if not row:
         return {
             "error": "Project not found",
             "project_id": project_id,
@@ -68,51 +274,64 @@ def calculate_project_files_size(db: Session, project_id: int) -> dict:
             "exists": False
         }
     
-    # Initialize counters
-    total_size = 0
-    file_count = 0
-    pdf_files = []
-    photo_files = []
-    
-    # Get all inspections for the project
-    inspections = db.query(ConstructionInspection).filter(ConstructionInspection.project_id == project_id).all()
-    
-    # Collect PDF paths
-    for inspection in inspections:
-        if inspection.pdf_path and os.path.exists(inspection.pdf_path):
-            pdf_files.append(inspection.pdf_path)
-            file_size = os.path.getsize(inspection.pdf_path)
-            total_size += file_size
-            file_count += 1
-    
-    # Get all photos for the inspections
-    for inspection in inspections:
-        photos = db.query(InspectionPhoto).filter(InspectionPhoto.inspection_id == inspection.id).all()
-        for photo in photos:
-            if photo.photo_path and os.path.exists(photo.photo_path):
-                photo_files.append(photo.photo_path)
-                file_size = os.path.getsize(photo.photo_path)
-                total_size += file_size
-                file_count += 1
-    
-    # Format the size for human readability
-    size_formatted = format_file_size(total_size)
+    project_name, total_size, pdf_count, photo_count = row
     
     return {
         "project_id": project_id,
-        "project_name": project.name,
+        "project_name": project_name,
         "total_size_bytes": total_size,
-        "total_size_formatted": size_formatted,
-        "file_count": file_count,
-        "pdf_count": len(pdf_files),
-        "photo_count": len(photo_files),
-        "exists": True,
-        "details": {
-            "pdf_files": pdf_files,
-            "photo_files": photo_files
-        }
+        "total_size_formatted": format_file_size(total_size),
+        "file_count": pdf_count + photo_count,
+        "pdf_count": pdf_count,
+        "photo_count": photo_count,
+        "exists": True
     }
 
+def reconcile_project_storage(db: Session, project_id: Optional[int] = None) -> List[dict]:
+    """
+    Re-measure the files of one or all projects and fix the recorded sizes.
+    
+    Args:
+        db: Database session
+        project_id: ID of the project, or None for every project
+        
+    Returns:
+        A list with the previous and corrected total of each project
+    """
+    from app.models.models import Project, ConstructionInspection, InspectionPhoto
+    
+    query = db.query(Project)
+    if project_id is not None:
+        query = query.filter(Project.id == project_id)
+    
+    results = []
+    for project in query.all():
+        total_size = 0
+        inspections = db.query(ConstructionInspection).filter(ConstructionInspection.project_id == project.id).all()
+        for inspection in inspections:
+            inspection.pdf_size = get_file_size(inspection.pdf_path) if inspection.pdf_path else 0
+            total_size += inspection.pdf_size
+        
+        photos = (
+            db.query(InspectionPhoto)
+            .join(ConstructionInspection)
+            .filter(ConstructionInspection.project_id == project.id)
+            .all()
+        )
+        for photo in photos:
+            photo.file_size = get_file_size(photo.photo_path)
+            total_size += photo.file_size
+        
+        results.append({
+            "project_id": project.id,
+            "previous_size_bytes": project.storage_bytes,
+            "total_size_bytes": total_size
+        })
+        project.storage_bytes = total_size
+    
+    db.commit()
+    return results
+
 def format_file_size(size_in_bytes: int) -> str:
     """
     Format file size from bytes to human-readable format
@@ -142,7 +361,7 @@ def generate_inspection_pdf(inspection_data, photos_data):
     
     # Create the PDF document
     doc = SimpleDocTemplate(file_path, pagesize=letter)
-    styles = getSampleStyleSheet()
+    styles = get_sample_styles()
     elements = []
     
     # Add inspection details
@@ -167,7 +386,7 @@ def generate_inspection_pdf(inspection_data, photos_data):
         
         for photo in photos_data:
             if os.path.exists(photo.photo_path):
-                img = RLImage(photo.photo_path, width=400, height=300)
+                img = RLImage(prepare_report_image(photo.photo_path, 400, 300) or photo.photo_path, width=400, height=300)
                 elements.append(img)
                 elements.append(Paragraph(f"說明: {photo.caption if photo.caption else '無'}", styles['Normal']))
                 elements.append(Paragraph(f"拍攝日期: {photo.capture_date}", styles['Normal']))
@@ -195,7 +414,6 @@ def merge_inspection_pdf_with_photos(inspection_pdf_path: str, photos: List[dict
     from reportlab.lib.pagesizes import A4
     from reportlab.lib import colors
     from reportlab.platypus import SimpleDocTemplate, Image, Table, TableStyle, Paragraph, PageBreak
-    from reportlab.lib.styles import getSampleStyleSheet
     from PyPDF2 import PdfReader, PdfWriter
     import io
     import os
@@ -210,7 +428,7 @@ def merge_inspection_pdf_with_photos(inspection_pdf_path: str, photos: List[dict
     
     # 創建照片頁面的 PDF
     doc = SimpleDocTemplate(temp_photos_pdf, pagesize=A4)
-    styles = getSampleStyleSheet()
+    styles = get_sample_styles()
     elements = []
     
     # 添加標題
@@ -226,7 +444,7 @@ def merge_inspection_pdf_with_photos(inspection_pdf_path: str, photos: List[dict
             current_row = []
         
         # 添加照片及其說明
-        img = Image(photo['photo_path'], width=150, height=150)
+        img = Image(prepare_report_image(photo['photo_path'], 150, 150) or photo['photo_path'], width=150, height=150)
         caption = f"{photo['caption']} ({photo['capture_date']})"
         current_row.append([img, Paragraph(caption, styles['Normal'])])
     
@@ -307,7 +525,7 @@ def generate_inspection_pdf(inspection, photos_data=None) -> str:
     
     # Create the PDF document
     doc = SimpleDocTemplate(file_path, pagesize=letter)
-    styles = getSampleStyleSheet()
+    styles = get_sample_styles()
     elements = []
     
     # Add inspection details
@@ -332,7 +550,7 @@ def generate_inspection_pdf(inspection, photos_data=None) -> str:
         
         for photo in photos_data:
             if os.path.exists(photo.photo_path):
-                img = RLImage(photo.photo_path, width=400, height=300)
+                img = RLImage(prepare_report_image(photo.photo_path, 400, 300) or photo.photo_path, width=400, height=300)
                 elements.append(img)
                 elements.append(Paragraph(f"說明: {photo.caption if photo.caption else '無'}", styles['Normal']))
                 elements.append(Paragraph(f"拍攝日期: {photo.capture_date}", styles['Normal']))
@@ -0,0 +1,64 @@
+import json
+import base64
+from datetime import date
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy import or_, and_
+
+# Page size used when the client does not ask for one, and the largest accepted
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values: list) -> str:
+    """Encode the sort key of the last row of a page as an opaque cursor"""
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> list:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(values, list):
+            raise ValueError("cursor is not a list")
+        return values
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def keyset_filter(columns: list, cursor: str):
+    """
+    Build the WHERE clause selecting rows after the cursor position.
+    
+    For sort columns (a, b) this is ``a > x OR (a = x AND b > y)``, which lets the
+    database seek straight to the position through an index on the same columns.
+    
+    Args:
+        columns: Sort columns, ending with a unique column such as the primary key
+        cursor: Cursor from the previous page
+        
+    Returns:
+        SQLAlchemy boolean expression
+    """
+    values = decode_cursor(cursor)
+    if len(values) != len(columns):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    
+    try:
+        values = [
+            date.fromisoformat(value) if column.type.python_type is date else value
+            for column, value in zip(columns, values)
+        ]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, column > values[i]))
+    return or_(*clauses)
+
+def next_cursor(items: list, columns: list, limit: int) -> Optional[str]:
+    """Return the cursor for the page after items, or None if this was the last page"""
+    if len(items) < limit:
+        return None
+    last = items[-1]
+    return encode_cursor([getattr(last, column.key) for column in columns])
@@ -0,0 +1,89 @@
+"""
+Rasterized previews of uploaded PDF pages.
+
+Pages are rendered once per PDF content, page and width and kept on disk, named
+by the SHA-256 of the PDF, so every client and API worker shares the same files
+and a replaced PDF never serves stale pages.
+"""
+import os
+import glob
+from functools import lru_cache
+from typing import Optional
+import pypdfium2 as pdfium
+from PyPDF2 import PdfReader
+from app.utils.file_utils import file_content_hash
+
+# Directory of the rendered page images
+PDF_PREVIEW_DIR = "app/static/cache/pdf_pages"
+
+# Requested widths are rounded up to a multiple of this to bound the number of variants
+PDF_PREVIEW_WIDTH_STEP = 128
+PDF_PREVIEW_DEFAULT_WIDTH = 1024
+PDF_PREVIEW_MAX_WIDTH = 2048
+
+@lru_cache(maxsize=1024)
+def _cached_page_count(pdf_path: str, content_hash: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+def pdf_page_count(pdf_path: str) -> int:
+    """Return the number of pages of a PDF"""
+    return _cached_page_count(pdf_path, file_content_hash(pdf_path))
+
+def preview_width(width: int) -> int:
+    """Round a requested width up to the next supported preview width"""
+    steps = -(-width // PDF_PREVIEW_WIDTH_STEP)
+    return min(steps * PDF_PREVIEW_WIDTH_STEP, PDF_PREVIEW_MAX_WIDTH)
+
+def pdf_page_preview_path(content_hash: str, page: int, width: int) -> str:
+    """Return the path of the rendered image of one page of a PDF"""
+    return os.path.join(PDF_PREVIEW_DIR, f"{content_hash}_p{page}_w{width}.png")
+
+def get_pdf_page_preview(pdf_path: str, page: int, width: int) -> Optional[str]:
+    """Return the path of a page image if it has already been rendered"""
+    path = pdf_page_preview_path(file_content_hash(pdf_path), page, width)
+    return path if os.path.exists(path) else None
+
+def render_pdf_page_preview(pdf_path: str, page: int, width: int) -> str:
+    """
+    Render one page of a PDF to a PNG of the given width.
+
+    CPU bound, so it is meant to run in the render process pool. pdfium is not
+    thread safe, which the single threaded pool workers also take care of.
+
+    Args:
+        pdf_path: Path of the PDF
+        page: 1-based page number
+        width: Width of the image in pixels
+
+    Returns:
+        Path of the rendered image
+    """
+    output_path = pdf_page_preview_path(file_content_hash(pdf_path), page, width)
+    if os.path.exists(output_path):
+        return output_path
+
+    os.makedirs(PDF_PREVIEW_DIR, exist_ok=True)
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        pdf_page = pdf[page - 1]
+        image = pdf_page.render(scale=width / pdf_page.get_width()).to_pil()
+    finally:
+        pdf.close()
+
+    # Write under a temporary name so a concurrent request never serves a partial file
+    temp_path = f"{output_path}.{os.getpid()}.part"
+    image.save(temp_path, "PNG", optimize=True)
+    os.replace(temp_path, output_path)
+    return output_path
+
+def delete_pdf_page_previews(pdf_path: str):
+    """Delete the rendered page images of a PDF (call before deleting the PDF itself)"""
+    try:
+        content_hash = file_content_hash(pdf_path)
+    except OSError:
+        return
+    for path in glob.glob(os.path.join(PDF_PREVIEW_DIR, f"{content_hash}_p*.png")):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error deleting page preview {path}: {e}")
@@ -0,0 +1,75 @@
+"""
+Photos prepared for embedding in generated PDFs.
+
+Originals are often full-resolution phone pictures, so each photo is resized to
+the pixel size of the box it is printed in at REPORT_IMAGE_DPI, turned upright
+according to its EXIF orientation and recompressed as JPEG. The copies are kept
+on disk, named by the SHA-256 of the original and the box size, so repeated
+report builds reuse them.
+"""
+import os
+import glob
+import math
+from typing import Optional
+from PIL import Image, ImageOps
+
+# Directory of the prepared copies
+REPORT_IMAGE_DIR = "app/static/cache/report_images"
+
+# Resolution of the embedded photos and JPEG quality of the copies
+REPORT_IMAGE_DPI = 150
+REPORT_IMAGE_QUALITY = 80
+
+def report_image_path(content_hash: str, width_px: int, height_px: int) -> str:
+    """Return the path of the prepared copy of a photo for a box of the given pixel size"""
+    return os.path.join(REPORT_IMAGE_DIR, f"{content_hash}_{width_px}x{height_px}.jpg")
+
+def prepare_report_image(photo_path: str, width: float, height: float) -> Optional[str]:
+    """
+    Return a copy of a photo sized for a printed box of width x height points.
+
+    Args:
+        photo_path: Path of the original photo
+        width: Width of the box in points
+        height: Height of the box in points
+
+    Returns:
+        Path of the prepared JPEG, or None if the original could not be read as an image
+    """
+    # Imported here because file_utils imports this module
+    from app.utils.file_utils import file_content_hash
+    
+    width_px = math.ceil(width / 72 * REPORT_IMAGE_DPI)
+    height_px = math.ceil(height / 72 * REPORT_IMAGE_DPI)
+    try:
+        output_path = report_image_path(file_content_hash(photo_path), width_px, height_px)
+        if os.path.exists(output_path):
+            return output_path
+
+        os.makedirs(REPORT_IMAGE_DIR, exist_ok=True)
+        with Image.open(photo_path) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert("RGB")
+            img.thumbnail((width_px, height_px))
+            # Write under a temporary name so a concurrent build never reads a partial file
+            temp_path = f"{output_path}.{os.getpid()}.part"
+            img.save(temp_path, "JPEG", quality=REPORT_IMAGE_QUALITY, optimize=True)
+        os.replace(temp_path, output_path)
+    except (OSError, ValueError) as e:
+        print(f"Error preparing photo {photo_path} for a report: {e}")
+        return None
+    return output_path
+
+def delete_report_images(photo_path: str):
+    """Delete the prepared copies of a photo (call before deleting the photo itself)"""
+    from app.utils.file_utils import file_content_hash
+    
+    try:
+        content_hash = file_content_hash(photo_path)
+    except OSError:
+        return
+    for path in glob.glob(os.path.join(REPORT_IMAGE_DIR, f"{content_hash}_*.jpg")):
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error deleting report image {path}: {e}")
@@ -0,0 +1,198 @@
+import os
+import tempfile
+from functools import lru_cache
+from typing import Dict, List
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle, StyleSheet1
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, PageBreak, Flowable, Image as RLImage
+from app.utils.report_images import prepare_report_image
+
+# Built-in Traditional Chinese font, so no TTF file has to be shipped
+REPORT_FONT = "MSung-Light"
+
+# Number of photos laid out on each report page
+PHOTOS_PER_PAGE = 3
+
+# Size of the chunks used to stream a finished report to the client
+REPORT_CHUNK_SIZE = 64 * 1024
+
+@lru_cache(maxsize=None)
+def register_report_fonts() -> str:
+    """Register the report font once per process and return its name"""
+    pdfmetrics.registerFont(UnicodeCIDFont(REPORT_FONT))
+    return REPORT_FONT
+
+@lru_cache(maxsize=None)
+def get_sample_styles() -> StyleSheet1:
+    """Return ReportLab's sample stylesheet, built once per process (do not modify it)"""
+    return getSampleStyleSheet()
+
+@lru_cache(maxsize=None)
+def get_report_styles() -> Dict[str, ParagraphStyle]:
+    """Return the paragraph styles of the photo report, built once per process"""
+    font = register_report_fonts()
+    styles = get_sample_styles()
+    return {
+        "title": ParagraphStyle(name="ReportTitle", parent=styles["Title"], fontName=font, fontSize=20, spaceAfter=12),
+        "sub_title": ParagraphStyle(name="ReportSubTitle", parent=styles["Title"], fontName=font, fontSize=14, alignment=2, spaceAfter=12),
+        "normal": ParagraphStyle(name="ReportNormal", parent=styles["Normal"], fontName=font, fontSize=12, leading=14, spaceAfter=6),
+    }
+
+def report_doc_template(output_path: str) -> SimpleDocTemplate:
+    """Return an A4 document template with the report margins"""
+    return SimpleDocTemplate(output_path, pagesize=A4, rightMargin=1 * cm, leftMargin=1 * cm, topMargin=1 * cm, bottomMargin=1 * cm)
+
+def _photo_flowable(photo_path: str, style):
+    """Return an image flowable for a photo, or a note if the file is not a readable image"""
+    width = height = 8 * cm
+    image_path = prepare_report_image(photo_path, width, height)
+    if image_path is None:
+        return Paragraph("無法讀取照片", style)
+    return RLImage(image_path, width=width, height=height, kind="proportional")
+
+class _PageMarker(Flowable):
+    """Zero-size flowable that records the number of the page it is drawn on"""
+    def __init__(self, pages: List[int]):
+        super().__init__()
+        self.pages = pages
+    
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+    
+    def draw(self):
+        self.pages.append(self.canv.getPageNumber())
+
+def _photo_page_elements(inspection) -> List:
+    """
+    Return the flowables of the photo pages of one inspection, three photos per page.
+    
+    Args:
+        inspection: Inspection with photos (attribute access)
+    """
+    styles = get_report_styles()
+    title_style = styles["title"]
+    sub_title_style = styles["sub_title"]
+    normal_style = styles["normal"]
+    
+    elements = []
+    photos = list(inspection.photos)
+    for start in range(0, len(photos), PHOTOS_PER_PAGE):
+        if start:
+            elements.append(PageBreak())
+        
+        elements.append(Paragraph("<b>抽查紀錄表照片</b>", title_style))
+        elements.append(Paragraph(f"抽查表名稱: {inspection.inspection_form_name}", sub_title_style))
+        
+        table_data = []
+        for photo in photos[start:start + PHOTOS_PER_PAGE]:
+            table_data.append([Paragraph("拍攝日期", normal_style), Paragraph(str(photo.capture_date), normal_style)])
+            table_data.append([Paragraph("說明", normal_style), Paragraph(photo.caption or "", normal_style)])
+            table_data.append([Paragraph("圖片", normal_style), _photo_flowable(photo.photo_path, normal_style)])
+        
+        table = Table(table_data, colWidths=[3 * cm, 12 * cm])
+        table.setStyle(TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("BACKGROUND", (0, 0), (0, -1), colors.lightgrey),
+            ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ]))
+        elements.append(table)
+    
+    return elements
+
+def build_photo_pages(inspections: List, output_path: str) -> List[int]:
+    """
+    Build the photo pages of several inspections in one document pass.
+    
+    Each inspection starts on a new page.
+    
+    Args:
+        inspections: Inspections with at least one photo (attribute access)
+        output_path: Where to write the PDF
+        
+    Returns:
+        The 0-based index of the first page of each inspection
+    """
+    start_pages = []
+    elements = []
+    for inspection in inspections:
+        if elements:
+            elements.append(PageBreak())
+        elements.append(_PageMarker(start_pages))
+        elements.extend(_photo_page_elements(inspection))
+    
+    report_doc_template(output_path).build(elements)
+    return [page - 1 for page in start_pages]
+
+def build_merged_report(inspections: List) -> str:
+    """
+    Build one PDF with, for each inspection, its uploaded form followed by its photo pages.
+    
+    The photo pages of all inspections are laid out in a single ReportLab pass
+    and parsed once, then interleaved with the uploaded forms. Everything is
+    read from and written to disk; the caller is responsible for deleting the
+    returned file.
+    
+    Args:
+        inspections: Inspections with photos, in report order
+        
+    Returns:
+        Path of the merged PDF in the system temp directory
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+    
+    with_photos = [inspection for inspection in inspections if inspection.photos]
+    photo_pages = []
+    photo_ranges = {}
+    
+    fd, photo_pages_path = tempfile.mkstemp(suffix=".pdf")
+    os.close(fd)
+    try:
+        if with_photos:
+            start_pages = build_photo_pages(with_photos, photo_pages_path)
+            photo_pages = PdfReader(photo_pages_path).pages
+            end_pages = start_pages[1:] + [len(photo_pages)]
+            photo_ranges = {id(inspection): range(start, end) for inspection, start, end in zip(with_photos, start_pages, end_pages)}
+        
+        writer = PdfWriter()
+        for inspection in inspections:
+            # Uploaded inspection form
+            if inspection.pdf_path and os.path.exists(inspection.pdf_path):
+                try:
+                    for page in PdfReader(inspection.pdf_path).pages:
+                        writer.add_page(page)
+                except Exception as e:
+                    # Skip unreadable uploads rather than failing the whole report
+                    print(f"Error reading PDF file {inspection.pdf_path}: {e}")
+            
+            # Photo pages
+            for index in photo_ranges.get(id(inspection), ()):
+                writer.add_page(photo_pages[index])
+        
+        fd, output_path = tempfile.mkstemp(suffix=".pdf", prefix="merged_report_")
+        with os.fdopen(fd, "wb") as f:
+            writer.write(f)
+    finally:
+        os.remove(photo_pages_path)
+    
+    return output_path
+
+def iter_file_chunks(file_path: str, chunk_size: int = REPORT_CHUNK_SIZE):
+    """Yield a file in chunks"""
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def delete_report_file(file_path: str):
+    """Delete a built report once its response has finished, whether or not it was sent"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import date, timedelta
+from alembic import command
+from sqlalchemy import MetaData, create_engine, insert, select, text
+from sqlalchemy.engine import make_url
+from migrate_db import alembic_config
+
+# Suffix a database name must have to be used with --url, because the benchmark drops all its tables
+SCRATCH_DATABASE_SUFFIX = "_bench"
+
+# Schema without the secondary indexes, and the current schema
+BASELINE_REVISION = "0001"
+CURRENT_REVISION = "head"
+
+def migrate(url: str, revision: str):
+    """Upgrade the database at url to an Alembic revision"""
+    command.upgrade(alembic_config(url), revision)
+
+def reflect(engine) -> MetaData:
+    """Return the tables currently in the database"""
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    return metadata
+
+def hot_queries(tables):
+    """The list queries issued by crud on every page load"""
+    projects = tables["projects"]
+    inspections = tables["construction_inspections"]
+    photos = tables["inspection_photos"]
+    return {
+        "get_projects_by_owner": select(projects).where(projects.c.owner == "owner_7"),
+        "get_inspections": select(inspections)
+            .where(inspections.c.project_id == 42)
+            .order_by(inspections.c.inspection_date),
+        "get_photos": select(photos).where(photos.c.inspection_id == 4242),
+    }
+
+def seed(connection, tables, projects: int, inspections_per_project: int, photos_per_inspection: int):
+    """Insert synthetic rows into the baseline schema"""
+    today = date.today()
+    connection.execute(insert(tables["projects"]), [
+        {
+            "id": p, "name": f"Project {p}", "location": "Site", "contractor": "Contractor",
+            "start_date": today, "end_date": today, "owner": f"owner_{p % 50}"
+        }
+        for p in range(1, projects + 1)
+    ])
+    inspection_id = 0
+    photo_rows = []
+    inspection_rows = []
+    for p in range(1, projects + 1):
+        for i in range(inspections_per_project):
+            inspection_id += 1
+            inspection_rows.append({
+                "id": inspection_id, "project_id": p, "subproject_name": "Sub",
+                "inspection_form_name": f"Form {i % 10}", "inspection_date": today - timedelta(days=i),
+                "location": "Here", "timing": "隨機抽查", "result": "合格"
+            })
+            for _ in range(photos_per_inspection):
+                photo_rows.append({
+                    "inspection_id": inspection_id, "photo_path": "app/static/uploads/photos/x.jpg",
+                    "capture_date": today
+                })
+    connection.execute(insert(tables["construction_inspections"]), inspection_rows)
+    connection.execute(insert(tables["inspection_photos"]), photo_rows)
+    connection.commit()
+
+def explain(connection, query) -> str:
+    """Return the database's query plan for a query"""
+    compiled = query.compile(connection, compile_kwargs={"literal_binds": True})
+    prefix = "EXPLAIN QUERY PLAN" if connection.dialect.name == "sqlite" else "EXPLAIN"
+    rows = connection.execute(text(f"{prefix} {compiled}")).fetchall()
+    return "\n".join("    " + " | ".join(str(col) for col in row) for row in rows)
+
+def run_queries(engine, repeat: int):
+    """Print the plan and the mean time of each hot query against the current schema"""
+    tables = reflect(engine).tables
+    with engine.connect() as connection:
+        for name, query in hot_queries(tables).items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(query).fetchall()
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"  {name}: {elapsed * 1000:.2f} ms")
+            print(explain(connection, query))
+
+def drop_all_tables(engine):
+    """Drop every table of the scratch database, including alembic_version"""
+    reflect(engine).drop_all(bind=engine)
+
+def check_scratch_database(url: str, force: bool):
+    """Refuse to run against a database that is not explicitly a scratch database"""
+    database = make_url(url).database or ""
+    name = os.path.splitext(os.path.basename(database))[0]
+    if not force and not name.endswith(SCRATCH_DATABASE_SUFFIX):
+        sys.exit(
+            f"Refusing to benchmark against {make_url(url).render_as_string(hide_password=True)}: "
+            f"all its tables are dropped. Use a database whose name ends with {SCRATCH_DATABASE_SUFFIX!r} "
+            "or pass --i-know-this-drops-tables."
+        )
+
+def main():
+    """Compare query plans of the hot list queries on the baseline schema and after all migrations"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--url",
+        help=f"Scratch database to benchmark against, its name must end with {SCRATCH_DATABASE_SUFFIX!r} "
+             "(all its tables are dropped). Defaults to a temporary SQLite file."
+    )
+    parser.add_argument(
+        "--i-know-this-drops-tables", dest="force", action="store_true",
+        help=f"Allow a --url whose database name does not end with {SCRATCH_DATABASE_SUFFIX!r}"
+    )
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--inspections", type=int, default=40, help="Inspections per project")
+    parser.add_argument("--photos", type=int, default=3, help="Photos per inspection")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    
+    temp_dir = None
+    if args.url:
+        check_scratch_database(args.url, args.force)
+        url = args.url
+    else:
+        # Migrations run on their own connections, so an in-memory database would not survive them
+        temp_dir = tempfile.mkdtemp()
+        url = f"sqlite:///{os.path.join(temp_dir, 'indexes_bench.db')}"
+    
+    engine = create_engine(url)
+    try:
+        drop_all_tables(engine)
+        migrate(url, BASELINE_REVISION)
+        with engine.connect() as connection:
+            seed(connection, reflect(engine).tables, args.projects, args.inspections, args.photos)
+        
+        print(f"Before (baseline schema, revision {BASELINE_REVISION}):")
+        run_queries(engine, args.repeat)
+        
+        migrate(url, CURRENT_REVISION)
+        print(f"\nAfter (all migrations, revision {CURRENT_REVISION}):")
+        run_queries(engine, args.repeat)
+    finally:
+        drop_all_tables(engine)
+        engine.dispose()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+"""
+Gunicorn settings (loaded automatically from the working directory).
+
+The API workers share their Prometheus metrics through PROMETHEUS_MULTIPROC_DIR:
+the directory is emptied when the server starts and the files of a worker are
+marked dead when it exits, so /metrics only reports live and finished workers.
+"""
+import os
+import shutil
+
+def on_starting(server):
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,57 @@
+import os
+import sys
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+from app.db.database import SQLALCHEMY_DATABASE_URL
+
+# Schema of the databases created by create_tables() before migrations were introduced
+BASELINE_REVISION = "0001"
+
+def alembic_config(url: str) -> Config:
+    """Return the Alembic configuration for the database at url"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    config = Config(os.path.join(base_dir, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(base_dir, "alembic"))
+    # Escape % because the value goes through ConfigParser interpolation
+    config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+    return config
+
+def upgrade_database(url: str = SQLALCHEMY_DATABASE_URL):
+    """
+    Bring a database to the latest migration.
+
+    Databases created by create_tables() have no alembic_version table. They are
+    stamped with the revision their tables match before upgrading:
+    - tables that already have the storage size columns were created from the
+      current models in one go, so they are stamped head
+    - otherwise they have the baseline schema. A render_jobs table next to them
+      was added by create_tables() of a newer release before its migrations ran.
+      Migration 0002 creates that table, so the leftover is dropped first (it only
+      holds the state of past PDF builds).
+    """
+    config = alembic_config(url)
+    engine = create_engine(url)
+    try:
+        inspector = inspect(engine)
+        tables = set(inspector.get_table_names())
+        if "alembic_version" not in tables and "projects" in tables:
+            project_columns = {column["name"] for column in inspector.get_columns("projects")}
+            if "storage_bytes" in project_columns:
+                command.stamp(config, "head")
+            else:
+                if "render_jobs" in tables:
+                    with engine.begin() as connection:
+                        connection.execute(text("DROP TABLE render_jobs"))
+                command.stamp(config, BASELINE_REVISION)
+    finally:
+        engine.dispose()
+    command.upgrade(config, "head")
+
+def main():
+    """Create or upgrade the database schema with the Alembic migrations"""
+    upgrade_database()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
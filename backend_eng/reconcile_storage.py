@@ -0,0 +1,26 @@
+import sys
+import argparse
+from app.db.database import SessionLocal
+from app.utils.file_utils import reconcile_project_storage, format_file_size
+
+def main():
+    """Re-measure uploaded files and fix the recorded project storage totals"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--project-id", type=int, default=None, help="Only reconcile this project")
+    args = parser.parse_args()
+    
+    with SessionLocal() as db:
+        results = reconcile_project_storage(db, project_id=args.project_id)
+    
+    for result in results:
+        drift = result["total_size_bytes"] - result["previous_size_bytes"]
+        print(
+            f"Project {result['project_id']}: "
+            f"{format_file_size(result['total_size_bytes'])} "
+            f"(drift {'+' if drift >= 0 else '-'}{format_file_size(abs(drift))})"
+        )
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
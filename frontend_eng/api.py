@@ -1,5 +1,8 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import streamlit as st
 
@@ -9,6 +12,98 @@ load_dotenv()
 # API 基礎 URL，預設為 localhost:8000
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 
+# 列表 API 每頁筆數（後端上限 500）
+PAGE_SIZE = 500
+# 合併報表一次最多包含的巡檢筆數（後端上限 500）
+MERGED_REPORT_MAX_INSPECTIONS = 500
+
+# 連線逾時與讀取逾時（秒），避免後端無回應時卡住整個頁面
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "3.05"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "60"))
+# 每個程序共用的連線池大小
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "10"))
+# 同時下載檔案（如圖廊縮圖）的執行緒數，不超過連線池大小
+API_DOWNLOAD_WORKERS = min(int(os.getenv("API_DOWNLOAD_WORKERS", "8")), API_POOL_SIZE)
+# GET 請求遇到連線失敗或 502/503/504 時的重試次數
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "3"))
+
+class APIError(Exception):
+    """API 呼叫失敗（連線錯誤、逾時或非預期的狀態碼）"""
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+def create_session():
+    """建立共用連線池的 Session，只有 GET/HEAD 會以退避方式重試"""
+    retry = Retry(
+        total=API_MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# 同一程序內的所有請求（包括 Streamlit 每次重跑的執行緒與下載執行緒）共用此 Session，
+# 以重複使用 keep-alive 連線；連線池由 urllib3 管理，可安全地跨執行緒使用。
+# 請求不修改 Session 的標頭或 cookie，每次呼叫的標頭都以參數傳入
+session = create_session()
+
+def call_api(method, url, expected_status=200, **kwargs):
+    """
+    經由共用 Session 呼叫 API，所有請求都帶有連線與讀取逾時。
+    狀態碼符合 expected_status 時回傳 Response，否則拋出 APIError。
+    """
+    kwargs.setdefault("timeout", (API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.RequestException as e:
+        raise APIError(f"API 連線錯誤: {e}") from e
+    if response.status_code != expected_status:
+        raise APIError(response.text or f"HTTP {response.status_code}", response.status_code)
+    return response
+
+def call_api_json(method, url, expected_status=200, **kwargs):
+    """呼叫 API 並回傳解析後的 JSON，回應內容不是 JSON 時同樣拋出 APIError"""
+    response = call_api(method, url, expected_status=expected_status, **kwargs)
+    try:
+        return response.json()
+    except ValueError as e:
+        raise APIError(f"API 回應不是有效的 JSON: {e}", response.status_code) from e
+
+def get_all_pages(url, params=None, headers=None):
+    """依 next_cursor 逐頁取得列表 API 的所有資料"""
+    params = dict(params or {}, limit=PAGE_SIZE)
+    items = []
+    while True:
+        page = call_api_json("GET", url, params=params, headers=headers)
+        items.extend(page["items"])
+        if not page.get("next_cursor"):
+            return items
+        params["cursor"] = page["next_cursor"]
+
+def download_file(url):
+    """下載單一檔案內容，失敗時回傳 APIError 而非拋出"""
+    try:
+        return call_api("GET", url).content
+    except APIError as e:
+        return e
+
+def download_files(urls):
+    """
+    以有限的執行緒池同時下載多個檔案，回傳 {url: bytes 或 APIError}。
+    單一檔案失敗不影響其他檔案。
+    """
+    urls = list(dict.fromkeys(urls))
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(API_DOWNLOAD_WORKERS, len(urls))) as executor:
+        return dict(zip(urls, executor.map(download_file, urls)))
+
 # 專案相關 API
 def get_projects(owner=None):
     """取得所有專案"""
@@ -17,14 +112,9 @@ def get_projects(owner=None):
         if owner:
             headers["owner"] = owner
             
-        response = requests.get(f"{API_BASE_URL}/api/projects/", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"取得專案失敗: {response.text}")
-            return []
-    except Exception as e:
-        st.error(f"API 連線錯誤: {str(e)}")
+        return get_all_pages(f"{API_BASE_URL}/api/projects/", headers=headers)
+    except APIError as e:
+        st.error(f"取得專案失敗: {e}")
         return []
 
 def get_project(project_id, owner=None):
@@ -34,14 +124,9 @@ def get_project(project_id, owner=None):
         if owner:
             headers["owner"] = owner
             
-        response = requests.get(f"{API_BASE_URL}/api/projects/{project_id}", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"取得專案詳細資料失敗: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"API 連線錯誤: {str(e)}")
+        return call_api_json("GET", f"{API_BASE_URL}/api/projects/{project_id}", headers=headers)
+    except APIError as e:
+        st.error(f"取得專案詳細資料失敗: {e}")
         return None
 
 def create_project(data):
@@ -58,12 +143,8 @@ def create_project(data):
         owner = data.get("owner")
         headers = {"owner": owner} if owner else {}
         
-        response = requests.post(f"{API_BASE_URL}/api/projects/", json=data, headers=headers)
-        if response.status_code == 201:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("POST", f"{API_BASE_URL}/api/projects/", json=data, headers=headers, expected_status=201)
+    except APIError as e:
         return {"error": str(e)}
 
 def update_project(project_id, data):
@@ -80,24 +161,16 @@ def update_project(project_id, data):
         owner = data.get("owner")
         headers = {"owner": owner} if owner else {}
         
-        response = requests.put(f"{API_BASE_URL}/api/projects/{project_id}", json=data, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("PUT", f"{API_BASE_URL}/api/projects/{project_id}", json=data, headers=headers)
+    except APIError as e:
         return {"error": str(e)}
 
 def delete_project(project_id, owner=None):
     """刪除專案"""
     try:
         headers = {"owner": owner} if owner else {}
-        response = requests.delete(f"{API_BASE_URL}/api/projects/{project_id}", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("DELETE", f"{API_BASE_URL}/api/projects/{project_id}", headers=headers)
+    except APIError as e:
         return {"error": str(e)}
 
 # 巡檢相關 API
@@ -109,29 +182,26 @@ def get_inspections(project_id=None):
         if project_id:
             params["project_id"] = project_id
         
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"取得巡檢失敗: {response.text}")
-            return []
-    except Exception as e:
-        st.error(f"API 連線錯誤: {str(e)}")
+        return get_all_pages(url, params=params)
+    except APIError as e:
+        st.error(f"取得巡檢失敗: {e}")
         return []
 
 def get_inspection(inspection_id):
     """取得單一巡檢詳細資料（含照片）"""
     try:
-        response = requests.get(f"{API_BASE_URL}/api/inspections/{inspection_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"取得巡檢詳細資料失敗: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"API 連線錯誤: {str(e)}")
+        return call_api_json("GET", f"{API_BASE_URL}/api/inspections/{inspection_id}")
+    except APIError as e:
+        st.error(f"取得巡檢詳細資料失敗: {e}")
         return None
 
+def download_merged_report(inspection_ids):
+    """由後端產生多筆巡檢的合併報表，回傳 PDF bytes"""
+    try:
+        return call_api("POST", f"{API_BASE_URL}/api/reports/merged", json={"ids": list(inspection_ids)}).content
+    except APIError as e:
+        return {"error": str(e)}
+
 def create_inspection(data):
     """建立新巡檢"""
     try:
@@ -141,12 +211,8 @@ def create_inspection(data):
             if field not in data:
                 return {"error": f"缺少必要欄位: {field}"}
         
-        response = requests.post(f"{API_BASE_URL}/api/inspections/", json=data)
-        if response.status_code == 201:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("POST", f"{API_BASE_URL}/api/inspections/", json=data, expected_status=201)
+    except APIError as e:
         return {"error": str(e)}
 
 def update_inspection(inspection_id, data):
@@ -156,67 +222,49 @@ def update_inspection(inspection_id, data):
         if "result" not in data:
             return {"error": "缺少必要欄位: result"}
         
-        response = requests.put(f"{API_BASE_URL}/api/inspections/{inspection_id}", json=data)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("PUT", f"{API_BASE_URL}/api/inspections/{inspection_id}", json=data)
+    except APIError as e:
         return {"error": str(e)}
 
 def delete_inspection(inspection_id):
     """刪除巡檢"""
     try:
-        response = requests.delete(f"{API_BASE_URL}/api/inspections/{inspection_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("DELETE", f"{API_BASE_URL}/api/inspections/{inspection_id}")
+    except APIError as e:
         return {"error": str(e)}
 
 def upload_inspection_pdf(inspection_id, file):
     """上傳巡檢 PDF"""
     try:
         files = {"file": (file.name,file.getvalue(), "application/pdf")}
-        response = requests.post(f"{API_BASE_URL}/api/inspections/{inspection_id}/upload-pdf", files=files)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("POST", f"{API_BASE_URL}/api/inspections/{inspection_id}/upload-pdf", files=files)
+    except APIError as e:
         return {"error": str(e)}
 
 # 照片相關 API
-def get_photos(inspection_id=None):
-    """取得所有照片，可選依巡檢篩選"""
+def get_photos(inspection_id=None, project_id=None, inspection_form_name=None, inspection_sequence=None):
+    """取得照片（含所屬抽查的地點、抽查表名稱與次數），可依巡檢、專案、抽查表名稱與次數篩選"""
     try:
         url = f"{API_BASE_URL}/api/photos/"
-        params = {}
-        if inspection_id:
-            params["inspection_id"] = inspection_id
+        params = {
+            "inspection_id": inspection_id,
+            "project_id": project_id,
+            "inspection_form_name": inspection_form_name,
+            "inspection_sequence": inspection_sequence
+        }
+        params = {key: value for key, value in params.items() if value is not None}
         
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"取得照片失敗: {response.text}")
-            return []
-    except Exception as e:
-        st.error(f"API 連線錯誤: {str(e)}")
+        return get_all_pages(url, params=params)
+    except APIError as e:
+        st.error(f"取得照片失敗: {e}")
         return []
 
 def get_photo(photo_id):
     """取得單一照片詳細資料"""
     try:
-        response = requests.get(f"{API_BASE_URL}/api/photos/{photo_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"取得照片詳細資料失敗: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"API 連線錯誤: {str(e)}")
+        return call_api_json("GET", f"{API_BASE_URL}/api/photos/{photo_id}")
+    except APIError as e:
+        st.error(f"取得照片詳細資料失敗: {e}")
         return None
 
 def upload_photo(inspection_id, file, capture_date, caption):
@@ -224,34 +272,22 @@ def upload_photo(inspection_id, file, capture_date, caption):
     try:
         files = {"file": (file.name, file, "image/jpeg")}
         data = {"inspection_id": inspection_id, "capture_date": capture_date, "caption": caption}
-        response = requests.post(f"{API_BASE_URL}/api/photos/", files=files, data=data)
-        if response.status_code == 201:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("POST", f"{API_BASE_URL}/api/photos/", files=files, data=data, expected_status=201)
+    except APIError as e:
         return {"error": str(e)}
 
 def update_photo(photo_id, data):
     """更新照片資料"""
     try:
-        response = requests.put(f"{API_BASE_URL}/api/photos/{photo_id}", json=data)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("PUT", f"{API_BASE_URL}/api/photos/{photo_id}", json=data)
+    except APIError as e:
         return {"error": str(e)}
 
 def delete_photo(photo_id):
     """刪除照片"""
     try:
-        response = requests.delete(f"{API_BASE_URL}/api/photos/{photo_id}")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"error": response.text}
-    except Exception as e:
+        return call_api_json("DELETE", f"{API_BASE_URL}/api/photos/{photo_id}")
+    except APIError as e:
         return {"error": str(e)}
 
 # 儲存空間相關 API
@@ -262,12 +298,9 @@ def get_project_storage(project_id, owner=None):
         if owner:
             headers["owner"] = owner
         
-        response = requests.get(f"{API_BASE_URL}/api/projects/{project_id}/storage", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            # st.error(f"獲取儲存空間信息失敗: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"API 連線錯誤: {str(e)}")
+        return call_api_json("GET", f"{API_BASE_URL}/api/projects/{project_id}/storage", headers=headers)
+    except APIError as e:
+        # 只顯示連線錯誤，後端回傳錯誤時靜默略過
+        if e.status_code is None:
+            st.error(str(e))
         return None
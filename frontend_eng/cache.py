@@ -0,0 +1,231 @@
+"""
+API 讀取結果的程序內快取
+
+包裝 api.py 的讀取函式，依資源設定存活時間（TTL），並以 owner、專案、巡檢、照片編號為鍵。
+寫入函式呼叫 API 成功後，只清除受影響的鍵，不會清空其他使用者或其他專案的快取。
+"""
+import copy
+import threading
+import time
+
+import api
+
+# 各資源的快取存活時間（秒）
+CACHE_TTL = {
+    "projects": 300,
+    "project": 300,
+    "inspections": 120,
+    "inspection": 120,
+    "photos": 120,
+    "photo": 120,
+    "storage": 60,
+}
+
+# (資源, 鍵) -> (到期時間, 資料)
+_entries = {}
+_lock = threading.Lock()
+
+# invalidate 的預設值，表示清除該資源的所有鍵
+ALL = object()
+
+def _key(value):
+    """統一鍵的型別（例如 DataFrame 取出的 numpy 整數）"""
+    return int(value) if value is not None else None
+
+def cached_read(resource, key, loader):
+    """
+    回傳資源的快取資料，不存在或過期時呼叫 loader 重新取得。
+    空結果不快取，因為讀取函式在連線錯誤時同樣回傳 None 或空列表。
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get((resource, key))
+    if entry and entry[0] > now:
+        return copy.deepcopy(entry[1])
+
+    value = loader()
+    if value:
+        with _lock:
+            _entries[(resource, key)] = (now + CACHE_TTL[resource], value)
+    return copy.deepcopy(value)
+
+def peek(resource, key):
+    """回傳仍有效的快取資料而不觸發 API 呼叫，沒有時回傳 None"""
+    with _lock:
+        entry = _entries.get((resource, key))
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def invalidate(resource, key=ALL):
+    """清除資源的單一鍵，未指定鍵時清除該資源的所有鍵"""
+    with _lock:
+        if key is ALL:
+            for entry_key in [k for k in _entries if k[0] == resource]:
+                del _entries[entry_key]
+        else:
+            _entries.pop((resource, key), None)
+
+def invalidate_matching(resource, match):
+    """清除資源中鍵符合 match(key) 的所有項目"""
+    with _lock:
+        for entry_key in [k for k in _entries if k[0] == resource and match(k[1])]:
+            del _entries[entry_key]
+
+def _invalidate_photo_lists(inspection_id=None, project_id=None):
+    """
+    清除可能包含某巡檢或某專案照片的照片列表。
+    照片列表的鍵為 (巡檢, 專案, 抽查表名稱, 次數)，未指定的篩選條件為 None。
+    """
+    def match(key):
+        key_inspection_id, key_project_id = key[0], key[1]
+        if key_inspection_id is not None:
+            return key_inspection_id == inspection_id
+        # 專案未知時，所有專案層級的列表都可能包含此照片
+        return project_id is None or key_project_id in (None, project_id)
+    invalidate_matching("photos", match)
+
+def _invalidate_project(project_id):
+    """
+    清除一個專案的資料與容量。
+    兩者的鍵為 (owner, 專案)，專案編號相同的各 owner 鍵都要清除。
+    """
+    invalidate_matching("project", lambda key: key[1] == project_id)
+    invalidate_matching("storage", lambda key: key[1] == project_id)
+
+def _invalidate_inspection_photos(inspection_id):
+    """清除屬於某巡檢的單張照片（照片以編號為鍵，需比對資料中的巡檢編號）"""
+    with _lock:
+        for entry_key in [
+            k for k, (_, value) in _entries.items()
+            if k[0] == "photo" and value.get("inspection_id") == inspection_id
+        ]:
+            del _entries[entry_key]
+
+def clear():
+    """清除所有快取"""
+    with _lock:
+        _entries.clear()
+
+# 專案相關
+def get_projects(owner=None):
+    return cached_read("projects", owner, lambda: api.get_projects(owner))
+
+def get_project(project_id, owner=None):
+    return cached_read("project", (owner, _key(project_id)), lambda: api.get_project(project_id, owner))
+
+def get_project_storage(project_id, owner=None):
+    return cached_read("storage", (owner, _key(project_id)), lambda: api.get_project_storage(project_id, owner))
+
+def create_project(data):
+    result = api.create_project(data)
+    if "error" not in result:
+        invalidate("projects", data.get("owner"))
+    return result
+
+def update_project(project_id, data):
+    result = api.update_project(project_id, data)
+    if "error" not in result:
+        # owner 可能被改掉，原 owner 的列表也要清除
+        invalidate("projects")
+        _invalidate_project(_key(project_id))
+    return result
+
+def delete_project(project_id, owner=None):
+    result = api.delete_project(project_id, owner)
+    if "error" not in result:
+        project_id = _key(project_id)
+        invalidate("projects", owner)
+        _invalidate_project(project_id)
+        invalidate("inspections", project_id)
+        invalidate("inspections", None)
+        # 專案底下的巡檢與照片編號未知，整批清除
+        invalidate("inspection")
+        invalidate("photos")
+        invalidate("photo")
+    return result
+
+# 巡檢相關
+def get_inspections(project_id=None):
+    return cached_read("inspections", _key(project_id), lambda: api.get_inspections(project_id))
+
+def get_inspection(inspection_id):
+    return cached_read("inspection", _key(inspection_id), lambda: api.get_inspection(inspection_id))
+
+def _invalidate_inspection(inspection):
+    """清除一筆巡檢及包含它的列表與專案資料"""
+    invalidate("inspection", inspection["id"])
+    invalidate("inspections", inspection["project_id"])
+    invalidate("inspections", None)
+    _invalidate_project(inspection["project_id"])
+    # 照片列表帶有巡檢的地點與抽查次數
+    _invalidate_photo_lists(inspection["id"], inspection["project_id"])
+
+def create_inspection(data):
+    result = api.create_inspection(data)
+    if "error" not in result:
+        _invalidate_inspection(result)
+    return result
+
+def update_inspection(inspection_id, data):
+    result = api.update_inspection(inspection_id, data)
+    if "error" not in result:
+        _invalidate_inspection(result)
+    return result
+
+def upload_inspection_pdf(inspection_id, file):
+    result = api.upload_inspection_pdf(inspection_id, file)
+    if "error" not in result:
+        _invalidate_inspection(result)
+    return result
+
+def delete_inspection(inspection_id):
+    result = api.delete_inspection(inspection_id)
+    if "error" not in result:
+        _invalidate_inspection(result)
+        # 巡檢的照片隨之刪除
+        _invalidate_inspection_photos(result["id"])
+    return result
+
+# 照片相關
+def get_photos(inspection_id=None, project_id=None, inspection_form_name=None, inspection_sequence=None):
+    key = (_key(inspection_id), _key(project_id), inspection_form_name, _key(inspection_sequence))
+    return cached_read(
+        "photos",
+        key,
+        lambda: api.get_photos(inspection_id, project_id, inspection_form_name, inspection_sequence)
+    )
+
+def get_photo(photo_id):
+    return cached_read("photo", _key(photo_id), lambda: api.get_photo(photo_id))
+
+def _invalidate_photo(photo):
+    """清除一張照片及包含它的列表、巡檢與專案容量資料"""
+    # 容量與專案照片列表以專案為鍵，巡檢不在快取中時無法得知所屬專案
+    inspection = peek("inspection", photo["inspection_id"])
+    project_id = inspection["project_id"] if inspection else None
+    if project_id is not None:
+        invalidate_matching("storage", lambda key: key[1] == project_id)
+    else:
+        invalidate("storage")
+    _invalidate_photo_lists(photo["inspection_id"], project_id)
+    invalidate("photo", photo["id"])
+    invalidate("inspection", photo["inspection_id"])
+
+def upload_photo(inspection_id, file, capture_date, caption):
+    result = api.upload_photo(inspection_id, file, capture_date, caption)
+    if "error" not in result:
+        _invalidate_photo(result)
+    return result
+
+def update_photo(photo_id, data):
+    result = api.update_photo(photo_id, data)
+    if "error" not in result:
+        _invalidate_photo(result)
+    return result
+
+def delete_photo(photo_id):
+    result = api.delete_photo(photo_id)
+    if "error" not in result:
+        _invalidate_photo(result)
+    return result
@@ -1,5 +1,5 @@
 import pandas as pd
-from api import get_projects, get_inspections, get_photos
+from cache import get_projects, get_inspections, get_photos
 
 def get_projects_df(owner):
     """將專案資料轉換為 DataFrame 格式"""
@@ -44,6 +44,7 @@ def get_inspections_df(project_id=None):
             "project_id": "專案編號",
             "subproject_name": "分項工程名稱",
             "inspection_form_name": "抽查表名稱",
+            "inspection_sequence": "抽查次數",
             "inspection_date": "抽查日期",
             "location": "檢查位置",
             "timing": "抽查時機",
@@ -54,10 +55,6 @@ def get_inspections_df(project_id=None):
             "updated_at": "更新時間"
         })
         
-        # 計算每個抽查表名稱的抽查次數
-        inspection_counts = df.groupby('抽查表名稱').cumcount() + 1
-        df['抽查次數'] = inspection_counts
-        
         # 轉換日期格式
         if "抽查日期" in df.columns:
             df["抽查日期"] = pd.to_datetime(df["抽查日期"]).dt.strftime("%Y-%m-%d")
@@ -68,9 +65,9 @@ def get_inspections_df(project_id=None):
     
     return df
 
-def get_photos_df(inspection_id=None):
-    """將照片資料轉換為 DataFrame 格式"""
-    photos = get_photos(inspection_id)
+def get_photos_df(inspection_id=None, project_id=None, inspection_form_name=None, inspection_sequence=None):
+    """將照片資料（含所屬抽查資訊）轉換為 DataFrame 格式"""
+    photos = get_photos(inspection_id, project_id, inspection_form_name, inspection_sequence)
     if not photos:
         return pd.DataFrame()
     
@@ -83,7 +80,11 @@ def get_photos_df(inspection_id=None):
             "inspection_id": "抽查編號",
             "photo_path": "檔案路徑",
             "caption": "描述",
-            "capture_date": "上傳時間"
+            "capture_date": "上傳時間",
+            "project_id": "專案編號",
+            "location": "檢查位置",
+            "inspection_form_name": "抽查表名稱",
+            "inspection_sequence": "抽查次數"
         })
         
         # 轉換日期格式
@@ -0,0 +1,133 @@
+"""
+PDF 頁面的按需渲染
+
+只渲染要顯示的那一頁，並以有容量上限的 LRU 快取保存 PDF 內容與渲染後的頁面，
+以檔案內容的 SHA-256 與頁碼為鍵，重新執行頁面或翻頁時不必重新下載或渲染整份文件。
+可選擇在背景預先渲染下一頁。
+
+已上傳到後端的 PDF 不在本地渲染，而是向後端取得已快取的單頁 PNG。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pypdfium2 as pdfium
+
+from api import call_api, call_api_json, API_BASE_URL
+
+# 渲染倍率（相對於 72 DPI）
+RENDER_SCALE = 2
+# 快取的 PDF 檔案數與渲染頁數上限
+MAX_CACHED_FILES = 8
+MAX_CACHED_PAGES = 32
+# 向後端要求的頁面圖像寬度（像素）
+REMOTE_PAGE_WIDTH = 1024
+
+class LRUCache:
+    """執行緒安全、有容量上限的 LRU 快取"""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+# 雜湊 -> PDF 內容、雜湊 -> 頁數、(雜湊, 頁碼) -> PIL 圖像
+_files = LRUCache(MAX_CACHED_FILES)
+_page_counts = LRUCache(MAX_CACHED_FILES)
+_pages = LRUCache(MAX_CACHED_PAGES)
+# 後端 PDF 路徑 -> 頁數、(後端 PDF 路徑, 頁碼) -> PNG bytes
+_remote_page_counts = LRUCache(MAX_CACHED_FILES)
+_remote_pages = LRUCache(MAX_CACHED_PAGES)
+
+# pdfium 不是執行緒安全的，所有開檔與渲染都要持有此鎖
+_pdfium_lock = threading.Lock()
+# 背景預先渲染下一頁用的單一執行緒
+_prefetcher = ThreadPoolExecutor(max_workers=1)
+
+def register_pdf(data):
+    """快取 PDF 內容並回傳其雜湊，之後以此雜湊取得頁數與頁面"""
+    file_hash = hashlib.sha256(data).hexdigest()
+    if _files.get(file_hash) is None:
+        _files.put(file_hash, data)
+    return file_hash
+
+def page_count(file_hash):
+    """回傳 PDF 的頁數"""
+    count = _page_counts.get(file_hash)
+    if count is None:
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(_files.get(file_hash))
+            try:
+                count = len(pdf)
+            finally:
+                pdf.close()
+        _page_counts.put(file_hash, count)
+    return count
+
+def _render(file_hash, page_index):
+    """渲染單一頁面並放入快取"""
+    image = _pages.get((file_hash, page_index))
+    if image is not None:
+        return image
+    data = _files.get(file_hash)
+    if data is None:
+        raise KeyError(f"PDF {file_hash} is no longer cached")
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(data)
+        try:
+            image = pdf[page_index].render(scale=RENDER_SCALE).to_pil()
+        finally:
+            pdf.close()
+    _pages.put((file_hash, page_index), image)
+    return image
+
+def _prefetch(file_hash, page_index):
+    """背景渲染，失敗時不影響目前頁面"""
+    try:
+        _render(file_hash, page_index)
+    except Exception as e:
+        print(f"Error prefetching page {page_index} of {file_hash}: {e}")
+
+def render_page(file_hash, page_index, prefetch_next=True):
+    """
+    回傳指定頁面的 PIL 圖像，只渲染這一頁。
+    prefetch_next 為 True 時，在背景預先渲染下一頁。
+    """
+    image = _render(file_hash, page_index)
+    if prefetch_next and page_index + 1 < page_count(file_hash) and _pages.get((file_hash, page_index + 1)) is None:
+        _prefetcher.submit(_prefetch, file_hash, page_index + 1)
+    return image
+
+def remote_page_count(inspection_id, pdf_path):
+    """
+    回傳已上傳到後端的抽查表 PDF 頁數，失敗時拋出 APIError。
+    後端的 PDF 路徑以內容雜湊命名，可直接作為快取鍵。
+    """
+    count = _remote_page_counts.get(pdf_path)
+    if count is None:
+        count = call_api_json("GET", f"{API_BASE_URL}/api/inspections/{inspection_id}/pdf/pages")["page_count"]
+        _remote_page_counts.put(pdf_path, count)
+    return count
+
+def render_remote_page(inspection_id, pdf_path, page_index, width=REMOTE_PAGE_WIDTH):
+    """回傳後端渲染並快取的單頁 PNG bytes（page_index 從 0 開始），失敗時拋出 APIError"""
+    image = _remote_pages.get((pdf_path, page_index))
+    if image is None:
+        url = f"{API_BASE_URL}/api/inspections/{inspection_id}/pdf/pages/{page_index + 1}.png"
+        image = call_api("GET", url, params={"width": width}).content
+        _remote_pages.put((pdf_path, page_index), image)
+    return image
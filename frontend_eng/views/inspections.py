@@ -2,7 +2,8 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import time
-from api import (
+from api import download_merged_report, MERGED_REPORT_MAX_INSPECTIONS
+from cache import (
     get_project,
     get_inspections,
     get_inspection,
@@ -15,7 +16,6 @@ from convert import get_projects_df, get_inspections_df
 
 from api import API_BASE_URL
 
-@st.cache_data()
 def get_merged_df(project_filter):
 
         # 取得抽查資料
@@ -75,7 +75,6 @@ def add_inspection_ui():
                 resp = create_inspection(data)
                 if "error" not in resp:
                     st.toast("新增抽查成功", icon="✅")
-                    st.cache_data.clear()
                     time.sleep(1)
                     st.rerun()
                 else:
@@ -155,7 +154,6 @@ def update_inspection_ui():
                     else:
                         st.error(f"PDF 上傳失敗: {pdf_response['error']}")
                 
-                st.cache_data.clear()
                 time.sleep(1)
                 st.rerun()
             else:
@@ -198,7 +196,6 @@ def delete_inspection_ui():
         response = delete_inspection(inspection_id)
         if "error" not in response:
             st.toast("抽查刪除成功", icon="✅")
-            st.cache_data.clear()
             time.sleep(1)
             st.rerun()
         else:
@@ -271,59 +268,23 @@ if selection:
             delete_inspection(inspection_id)
             st.toast("刪除成功", icon="✅")
 
-        st.cache_data.clear()
         time.sleep(1)
         st.rerun()
 
 st.markdown("---")
 
-if len(selection) > 0:
+if len(selection) > MERGED_REPORT_MAX_INSPECTIONS:
+    st.warning(f"一次最多合併 {MERGED_REPORT_MAX_INSPECTIONS} 筆報表，目前選擇 {len(selection)} 筆，請縮小選擇範圍")
+elif len(selection) > 0:
     if st.button("📝列印報表", key="print_multiple"):
-        from utils import generate_pdf, merge_multiple_pdfs
-        
         # 取得所有選中的抽查報表數據
         filtered_df = df.iloc[selection]
+        selected_ids = [int(insp_id) for insp_id in filtered_df['抽查編號']]
 
-        pdf_files_list = []
-        
-        # 遍歷所有選中的抽查
-        for i, (_, row) in enumerate(filtered_df.iterrows()):
+        # 由後端直接以磁碟上的檔案產生合併報表
+        merged_pdf_bytes = download_merged_report(selected_ids)
 
-            # 獲取完整的抽查數據
-            insp_id = int(row['抽查編號'])
-            insp_data = get_inspection(insp_id)
-            # st.write(insp_data)
-            
-            if insp_data:
-                # # 添加原始 PDF（如果有）
-                # if insp_data.get('pdf_path'):
-                #     pdf_url = f"http://localhost:8000/{insp_data.get('pdf_path')}"
-                #     pdf_files_list.append((pdf_url, True))
-                
-                # # 生成並添加照片報告 PDF
-                # photo_pdf_bytes = generate_pdf(insp_data)
-                # pdf_files_list.append((photo_pdf_bytes, False))
-                # 添加原始 PDF（如果有）
-                if insp_data.get('pdf_path'):
-                    pdf_url = f"{API_BASE_URL}/{insp_data.get('pdf_path')}"
-                    pdf_files_list.append((pdf_url, True))
-
-                # 照片分組，每3張為一組
-                photos = insp_data.get('photos', [])
-                for j in range(0, len(photos), 3):
-                    photo_group = photos[j:j+3]
-                    
-                    # 為這組照片建立新的 inspection data (僅包含這組照片)
-                    temp_insp_data = insp_data.copy()
-                    temp_insp_data["photos"] = photo_group
-
-                    # 生成報告 PDF 並加入清單
-                    photo_pdf_bytes = generate_pdf(temp_insp_data)
-                    pdf_files_list.append((photo_pdf_bytes, False))
-        # 合併所有 PDF
-        merged_pdf_bytes = merge_multiple_pdfs(pdf_files_list)
-        
-        if merged_pdf_bytes:
+        if isinstance(merged_pdf_bytes, bytes):
             # 在 Streamlit 中顯示下載按鈕
             st.download_button(
                 label="下載合併 PDF 報告",
@@ -332,4 +293,4 @@ if len(selection) > 0:
                 mime="application/pdf"
             )
         else:
-            st.error("合併 PDF 失敗，請確認選擇的報表有效。")
+            st.error(f"合併 PDF 失敗，請確認選擇的報表有效。{merged_pdf_bytes.get('error', '')}")
@@ -1,8 +1,8 @@
 import streamlit as st
-import pypdfium2 as pdfium
 import datetime
 
-from api import get_projects, create_inspection, upload_inspection_pdf, upload_photo, get_project_storage
+from pdf_pages import register_pdf, page_count, render_page
+from cache import get_projects, create_inspection, upload_inspection_pdf, upload_photo, get_project_storage
 
 if "photos" not in st.session_state:
     st.session_state.photos = []  # 用來儲存多張照片的列表
@@ -13,25 +13,23 @@ if "project_id" not in st.session_state:
 
 # PDF 初始化（不儲存檔案）
 def initialize_pdf(uploaded_file):
-    """直接使用上傳的檔案初始化 PDF 並返回頁數與圖像"""
+    """快取上傳的 PDF 內容並返回頁數與檔案雜湊，頁面在顯示時才渲染"""
     try:
-        pdf = pdfium.PdfDocument(uploaded_file)
-        total_pages = len(pdf)
-        pdf_images = {i: pdf[i].render(scale=2).to_pil() for i in range(total_pages)}
-        return total_pages, pdf_images
+        pdf_key = register_pdf(uploaded_file.getvalue())
+        return page_count(pdf_key), pdf_key
     except Exception as e:
         st.error(f"❌ PDF 初始化錯誤: {e}")
         return None, None
 
 # 顯示 PDF 頁面
-def display_pdf_page(total_pages, pdf_images):
-    """顯示目前頁面"""
+def display_pdf_page(total_pages, pdf_key):
+    """只渲染並顯示目前頁面，並在背景預先渲染下一頁"""
     if "current_page" not in st.session_state:
         st.session_state.current_page = 0
 
     current_page = st.session_state.current_page
     if 0 <= current_page < total_pages:
-        image_to_show = pdf_images[current_page]
+        image_to_show = render_page(pdf_key, current_page)
         st.image(image_to_show, caption=f"📄 頁數 {current_page + 1} / {total_pages}")
 
 # 分頁控制
@@ -206,9 +204,9 @@ with col4:
         # with st.expander("📑 PDF 預覽", expanded=True):
         pdf_file = st.session_state.get("pdf_file", None)
         if pdf_file:
-            total_pages, pdf_images = initialize_pdf(pdf_file)
-            if total_pages and pdf_images:
-                display_pdf_page(total_pages, pdf_images)
+            total_pages, pdf_key = initialize_pdf(pdf_file)
+            if total_pages and pdf_key:
+                display_pdf_page(total_pages, pdf_key)
                 pagination_controls(total_pages)
         else:
             st.info("尚未上傳 PDF。")
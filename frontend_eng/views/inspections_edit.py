@@ -1,11 +1,11 @@
 import streamlit as st
-import pypdfium2 as pdfium
 import datetime
 import os
-import requests
 from io import BytesIO
 
-from api import get_projects, get_inspections, get_inspection, update_inspection, upload_inspection_pdf, upload_photo
+from api import call_api, APIError
+from pdf_pages import register_pdf, page_count, render_page, remote_page_count, render_remote_page
+from cache import get_projects, get_inspections, get_inspection, update_inspection, upload_inspection_pdf, upload_photo
 
 if "photos" not in st.session_state:
     st.session_state.photos = []  # 用來儲存多張照片的列表
@@ -19,33 +19,45 @@ if "inspection_data" not in st.session_state:
 # API 基礎 URL，預設為 localhost:8000
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 
-# 從URL獲取PDF並初始化
-def initialize_pdf_from_url(pdf_url):
-    """從URL獲取PDF檔案並初始化"""
+# 取得已上傳 PDF 的頁數
+def initialize_remote_pdf(inspection_id, pdf_path):
+    """向後端取得已上傳 PDF 的頁數，不下載整份 PDF"""
     try:
-        response = requests.get(pdf_url)
-        if response.status_code == 200:
-            pdf_bytes = BytesIO(response.content)
-            pdf = pdfium.PdfDocument(pdf_bytes)
-            total_pages = len(pdf)
-            pdf_images = {i: pdf[i].render(scale=2).to_pil() for i in range(total_pages)}
-            return total_pages, pdf_images
-        else:
-            st.error(f"❌ 無法獲取PDF: HTTP {response.status_code}")
-            return None, None
+        return remote_page_count(inspection_id, pdf_path)
+    except APIError as e:
+        st.error(f"❌ 無法獲取PDF: {e}")
+        return None
+
+# PDF 初始化（不儲存檔案）
+def initialize_pdf(uploaded_file):
+    """快取上傳的 PDF 內容並返回頁數與檔案雜湊，頁面在顯示時才渲染"""
+    try:
+        pdf_key = register_pdf(uploaded_file.getvalue())
+        return page_count(pdf_key), pdf_key
     except Exception as e:
         st.error(f"❌ PDF 初始化錯誤: {e}")
         return None, None
 
 # 顯示 PDF 頁面
-def display_pdf_page(total_pages, pdf_images):
-    """顯示目前頁面"""
+def display_pdf_page(total_pages, pdf_key):
+    """只渲染並顯示目前頁面，並在背景預先渲染下一頁"""
     if "current_page" not in st.session_state:
         st.session_state.current_page = 0
 
     current_page = st.session_state.current_page
     if 0 <= current_page < total_pages:
-        image_to_show = pdf_images[current_page]
+        image_to_show = render_page(pdf_key, current_page)
+        st.image(image_to_show, caption=f"📄 頁數 {current_page + 1} / {total_pages}")
+
+# 顯示已上傳 PDF 的頁面
+def display_remote_pdf_page(total_pages, inspection_id, pdf_path):
+    """只向後端取得目前頁面的圖像，頁面由後端渲染並快取"""
+    if "current_page" not in st.session_state:
+        st.session_state.current_page = 0
+
+    current_page = st.session_state.current_page
+    if 0 <= current_page < total_pages:
+        image_to_show = render_remote_page(inspection_id, pdf_path, current_page)
         st.image(image_to_show, caption=f"📄 頁數 {current_page + 1} / {total_pages}")
 
 # 分頁控制
@@ -226,9 +238,9 @@ if st.session_state.selected_inspection_id and st.session_state.inspection_data:
         with tabs[0]:
             pdf_file = st.session_state.get("pdf_file", None)
             if pdf_file:
-                total_pages, pdf_images = initialize_pdf(pdf_file)
-                if total_pages and pdf_images:
-                    display_pdf_page(total_pages, pdf_images)
+                total_pages, pdf_key = initialize_pdf(pdf_file)
+                if total_pages and pdf_key:
+                    display_pdf_page(total_pages, pdf_key)
                     pagination_controls(total_pages)
             elif inspection_data.get("pdf_path"):
                 # 構建PDF的完整URL
@@ -238,9 +250,9 @@ if st.session_state.selected_inspection_id and st.session_state.inspection_data:
                 
                 # 嘗試顯示PDF
                 try:
-                    total_pages, pdf_images = initialize_pdf_from_url(pdf_url)
-                    if total_pages and pdf_images:
-                        display_pdf_page(total_pages, pdf_images)
+                    total_pages = initialize_remote_pdf(inspection_data["id"], inspection_data["pdf_path"])
+                    if total_pages:
+                        display_remote_pdf_page(total_pages, inspection_data["id"], inspection_data["pdf_path"])
                         pagination_controls(total_pages)
                     else:
                         st.info("無法顯示PDF預覽，但您可以點擊上方連結查看。")
@@ -257,6 +269,7 @@ if st.session_state.selected_inspection_id and st.session_state.inspection_data:
                 if photo.get('photo_path'):
                     photo_filename = os.path.basename(photo['photo_path'])
                     photo_url = f"{API_BASE_URL}/{photo['photo_path']}"
+                    preview_url = f"{API_BASE_URL}/{photo['preview_url']}" if photo.get('preview_url') else photo_url
                     
                     # 顯示照片資訊
                     st.markdown(f"**照片ID**: {photo.get('id', '無ID')}")
@@ -265,12 +278,11 @@ if st.session_state.selected_inspection_id and st.session_state.inspection_data:
                     
                     # 顯示照片
                     try:
-                        response = requests.get(photo_url)
-                        if response.status_code == 200:
-                            st.image(BytesIO(response.content), caption=photo.get('caption', '無說明'))
-                        else:
-                            st.error(f"無法獲取照片: HTTP {response.status_code}")
-                            st.markdown(f"**照片連結**: [{photo_filename}]({photo_url})")
+                        response = call_api("GET", preview_url)
+                        st.image(BytesIO(response.content), caption=photo.get('caption', '無說明'))
+                    except APIError as e:
+                        st.error(f"無法獲取照片: {e}")
+                        st.markdown(f"**照片連結**: [{photo_filename}]({photo_url})")
                     except Exception as e:
                         st.error(f"照片顯示錯誤: {e}")
                         st.markdown(f"**照片連結**: [{photo_filename}]({photo_url})")
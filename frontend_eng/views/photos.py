@@ -3,8 +3,8 @@ import pandas as pd
 import time
 import os
 from io import BytesIO
-import requests
-from api import (
+from api import call_api, APIError, download_files
+from cache import (
     get_photos,
     get_photo,
     upload_photo,
@@ -19,55 +19,33 @@ from convert import get_inspections_df, get_photos_df
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 
 def get_project_photos_df():
-
-    inspections_df = get_inspections_df(st.session_state.active_project_id)
-    # 取得照片資料
-    df = get_photos_df()
+    # 只取得目前專案的照片，後端會附上所屬抽查的資訊
+    df = get_photos_df(project_id=st.session_state.active_project_id)
     
     if df.empty:
         st.info("目前沒有照片資料")
         st.stop()
         return
-    
-    # 合併抽查資訊
-    if not inspections_df.empty:
-        df = pd.merge(
-            df, 
-            inspections_df[["抽查編號", "檢查位置", "抽查表名稱", "抽查次數"]], 
-            left_on="抽查編號", 
-            right_on="抽查編號", 
-            how="right"
-        )
 
     return df
 
 # @st.cache_data()
 def get_filter_df(inspection_name=None, inspection_count=None):
-    # 取得照片資料
-    df = get_project_photos_df()
-    
-    # if df.empty:
-    #     st.info("目前沒有照片資料")
-    #     st.stop()
-    #     return
-    
-    # # 合併抽查資訊
-    # if not inspections_df.empty:
-    #     df = pd.merge(
-    #         df, 
-    #         inspections_df[["抽查編號", "檢查位置", "抽查表名稱", "抽查次數"]], 
-    #         left_on="抽查編號", 
-    #         right_on="抽查編號", 
-    #         how="left"
-    #     )
-
     # 根據選擇的抽查表名稱和次數進行篩選
+    form_name = None
+    count_num = None
     if inspection_name != "全部抽查表":
-        df = df[df["抽查表名稱"] == inspection_name]
+        form_name = inspection_name
         
         if inspection_count != "全部次數":
             count_num = int(inspection_count.replace("第", "").replace("次", ""))
-            df = df[df["抽查次數"] == count_num]
+    
+    # 由後端篩選，只取得要顯示的照片
+    df = get_photos_df(
+        project_id=st.session_state.active_project_id,
+        inspection_form_name=form_name,
+        inspection_sequence=count_num
+    )
     
     if df.empty:
         st.info("沒有符合篩選條件的照片")
@@ -113,10 +91,15 @@ def get_filter_options():
 
     return selected_inspection_name, selected_count
 
-def single_card(row):
+def gallery_image_url(row):
+    """圖廊只下載縮圖，沒有縮圖時才使用原圖"""
+    photo_url = f"{API_BASE_URL}/{row['檔案路徑']}"
+    return f"{API_BASE_URL}/{row['thumbnail_url']}" if pd.notna(row.get('thumbnail_url')) else photo_url
+
+def single_card(row, image):
     # 構建照片的完整URL
     if '檔案路徑' in row:
-        photo_filename = os.path.basename(row['檔案路徑'])
+        photo_filename = os.path.basename(str(row['檔案路徑']))
         photo_url = f"{API_BASE_URL}/{row['檔案路徑']}"
         
         # 顯示照片資訊
@@ -124,14 +107,13 @@ def single_card(row):
         # st.markdown(f"**照片說明**: {row.get('描述', '無說明')}")
         st.markdown(f"**檢查位置**: {row.get('檢查位置', '無位置')}")
         
-        # 顯示照片
+        # 顯示已預先下載的照片
         try:
-            response = requests.get(photo_url)
-            if response.status_code == 200:
-                st.image(BytesIO(response.content), caption=row.get('描述', '無說明'))
-            else:
-                st.error(f"無法獲取照片: HTTP {response.status_code}")
+            if image is None or isinstance(image, APIError):
+                st.error(f"無法獲取照片: {image or '沒有照片檔案'}")
                 st.markdown(f"**照片連結**: [{photo_filename}]({photo_url})")
+            else:
+                st.image(BytesIO(image), caption=row.get('描述', '無說明'))
         except Exception as e:
             st.error(f"照片顯示錯誤: {e}")
             st.markdown(f"**照片連結**: [{photo_filename}]({photo_url})")
@@ -166,7 +148,6 @@ def upload_photo_ui():
             response = upload_photo(inspection_id, photo_file,capture_date.strftime("%Y-%m-%d"), caption)
             if "error" not in response:
                 st.toast("照片上傳成功", icon="✅")
-                st.cache_data.clear()
                 time.sleep(1)
                 st.rerun()
             else:
@@ -212,14 +193,14 @@ def update_photo_ui():
     with st.form("edit_photo_form"):
         # 顯示照片預覽
         photo_url = f"{API_BASE_URL}/{photo['photo_path']}"
+        preview_url = f"{API_BASE_URL}/{photo['preview_url']}" if photo.get('preview_url') else photo_url
         try:
-            response = requests.get(photo_url)
-            if response.status_code == 200:
-                st.image(BytesIO(response.content), caption=photo.get('caption', '無說明'))
-            else:
-                st.error(f"無法獲取照片: HTTP {response.status_code}")
-                photo_filename = os.path.basename(photo['photo_path'])
-                st.markdown(f"**照片連結**: [{photo_filename}]({photo_url})")
+            response = call_api("GET", preview_url)
+            st.image(BytesIO(response.content), caption=photo.get('caption', '無說明'))
+        except APIError as e:
+            st.error(f"無法獲取照片: {e}")
+            photo_filename = os.path.basename(photo['photo_path'])
+            st.markdown(f"**照片連結**: [{photo_filename}]({photo_url})")
         except Exception as e:
             st.error(f"照片顯示錯誤: {e}")
             photo_filename = os.path.basename(photo['photo_path'])
@@ -236,7 +217,6 @@ def update_photo_ui():
             response = update_photo(photo_id, data)
             if "error" not in response:
                 st.toast("照片更新成功", icon="✅")
-                st.cache_data.clear()
                 time.sleep(1)
                 st.rerun()
             else:
@@ -279,7 +259,6 @@ def delete_photo_ui():
         response = delete_photo(photo_id)
         if "error" not in response:
             st.toast("照片刪除成功", icon="✅")
-            st.cache_data.clear()
             time.sleep(1)
             st.rerun()
         else:
@@ -296,10 +275,13 @@ df=get_filter_df(selected_inspection_name, selected_count)
 if not df.empty:
     st.subheader(f"📸 照片圖廊")
     st.info(f"目前工程-> {st.session_state.active_project}")
+    # 先同時下載所有縮圖，再依序排入三欄
+    rows = [row for _, row in df.iterrows()]
+    images = download_files(gallery_image_url(row) for row in rows if pd.notna(row['檔案路徑']))
     cols = st.columns(3, border=True)
-    for i, (_, row) in enumerate(df.iterrows()):
+    for i, row in enumerate(rows):
         with cols[i % 3]:
-            single_card(row)
+            single_card(row, images.get(gallery_image_url(row)) if pd.notna(row['檔案路徑']) else None)
 
 st.markdown("---")
 
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import time
 from datetime import datetime
-from api import (
+from cache import (
     get_projects,
     get_project,
     create_project,
@@ -94,7 +94,6 @@ def add_project_ui():
             response = create_project(data)
             if "error" not in response:
                 st.toast("專案建立成功", icon="✅")
-                st.cache_data.clear()
                 time.sleep(1)
                 st.rerun()
             else:
@@ -157,7 +156,6 @@ def update_project_ui():
             response = update_project(project_id, data)
             if "error" not in response:
                 st.toast("專案更新成功", icon="✅")
-                st.cache_data.clear()
                 time.sleep(1)
                 st.rerun()
             else:
@@ -190,7 +188,6 @@ def delete_project_ui():
         response = delete_project(project_id, owner="TEST_EMAIL")#st.user.email)
         if "error" not in response:
             st.toast("專案刪除成功", icon="✅")
-            st.cache_data.clear()
             time.sleep(1)
             st.rerun()
         else: